@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合并请求队列 - 读写 merge_requests.jsonl
+每行一个JSON格式的合并请求，新请求只追加到文件末尾
+处理结果追加到 merge_statuses.jsonl，已处理到的位置记录在 .processed_offset
+"""
+
+import os
+import json
+import socket
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows上使用msvcrt加锁
+    fcntl = None
+    import msvcrt
+
+try:
+    import orjson
+except ImportError:  # 没有安装orjson时使用标准库json
+    orjson = None
+
+REQUEST_FILE = Path("merge_requests.jsonl")
+# 请求的处理结果单独追加到状态文件，请求文件本身只追加不重写
+STATUS_FILE = Path("merge_statuses.jsonl")
+# 已处理到的请求文件字节位置，重启后从这里继续读取
+OFFSET_FILE = Path(".processed_offset")
+# 请求全部处理完且文件超过这个大小时轮转请求文件和状态文件
+ROTATE_SIZE = 1024 * 1024
+# Hook模式的智能体在这个地址监听Hook脚本的通知
+HOOK_SOCKET = Path("hook.sock")
+# 不支持AF_UNIX时（Windows）改用本机TCP端口
+HOOK_PORT = 47391
+
+def hook_address():
+    """返回智能体监听Hook通知的 (地址族, 地址)"""
+    if hasattr(socket, 'AF_UNIX'):
+        return socket.AF_UNIX, str(HOOK_SOCKET)
+    return socket.AF_INET, ('127.0.0.1', HOOK_PORT)
+
+def send_hook_event(repository_path, revision, timeout=1.0):
+    """把新提交通知给正在运行的智能体，智能体没有运行时返回False"""
+    family, address = hook_address()
+    try:
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(address)
+            sock.sendall(f"{repository_path}\t{revision}\n".encode('utf-8'))
+        return True
+    except OSError:
+        return False
+
+def atomic_write(path, data):
+    """先写临时文件再替换，读取方不会读到只写了一半的文件"""
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+@contextmanager
+def _request_lock(request_file):
+    """进程间互斥锁：追加请求和轮转请求文件不能同时进行"""
+    request_file = Path(request_file)
+    lock_path = request_file.with_name(request_file.name + '.lock')
+    with open(lock_path, 'a+b') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        else:
+            lock.seek(0)
+            while True:
+                try:
+                    # LK_LOCK 重试10秒仍拿不到锁时抛出OSError，继续等待
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _encode_line(request):
+    """把一条请求编码成以换行结尾的一行UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(request, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(request, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+def _decode_line(line):
+    """解析一行JSON（bytes）"""
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+def load_json(path):
+    """读取JSON文件（配置、缓存等），安装了orjson时直接解析bytes"""
+    with open(path, 'rb') as f:
+        return _decode_line(f.read())
+
+def dump_json(obj):
+    """把对象编码成UTF-8 JSON（bytes）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def append_request(merge_request, request_file=REQUEST_FILE):
+    """追加一条合并请求，不需要读取和重写已有的请求"""
+    line = _encode_line(merge_request)
+    with _request_lock(request_file):
+        with open(request_file, 'ab') as f:
+            f.write(line)
+
+def load_requests(request_file=REQUEST_FILE):
+    """读取全部合并请求"""
+    requests = []
+    try:
+        with open(request_file, 'rb') as f:
+            for line in f:
+                # 没有换行结尾的行可能还在写入中，留到下次再读
+                if not line.endswith(b'\n'):
+                    break
+                if line.strip():
+                    requests.append(_decode_line(line))
+    except FileNotFoundError:
+        pass
+    return requests
+
+def read_new_requests(f, offset):
+    """从已打开（二进制模式）的请求文件的字节位置offset开始读取新追加的请求
+    
+    返回 ([(请求所在行的起始位置, 请求), ...], 最后一个完整行之后的位置)
+    """
+    entries = []
+    f.seek(offset)
+    for line in f:
+        # 没有换行结尾的行可能还在写入中，留到下次再读
+        if not line.endswith(b'\n'):
+            break
+        if line.strip():
+            entries.append((offset, _decode_line(line)))
+        offset += len(line)
+    return entries, offset
+
+def request_key(request):
+    """请求的去重键 (版本号, 仓库路径)，没有记录仓库的请求仓库为None"""
+    return int(request['revision']), request.get('repository')
+
+def load_request_keys(offset, request_file=REQUEST_FILE):
+    """读取已处理请求的去重键：上次轮转出的文件和当前文件offset之前的请求"""
+    keys = set()
+    for path, end in ((_rotated_path(request_file), -1), (Path(request_file), offset)):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read(end)
+        except FileNotFoundError:
+            continue
+        for line in data.splitlines():
+            try:
+                keys.add(request_key(_decode_line(line)))
+            except (ValueError, KeyError, TypeError):
+                # 空行、写了一半的行
+                continue
+    return keys
+
+def append_status(offset, request, status, status_file=STATUS_FILE):
+    """记录请求的处理结果，请求由它在请求文件中的起始位置标识"""
+    line = _encode_line({'offset': offset, 'revision': request.get('revision'), 'status': status})
+    with open(status_file, 'ab') as f:
+        f.write(line)
+
+def load_offset(offset_file=OFFSET_FILE):
+    """读取已处理到的请求文件位置"""
+    try:
+        return int(Path(offset_file).read_text(encoding='utf-8').strip())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def save_offset(offset, offset_file=OFFSET_FILE):
+    """保存已处理到的请求文件位置"""
+    atomic_write(offset_file, str(offset).encode('ascii'))
+
+def _rotated_path(path):
+    path = Path(path)
+    return path.with_name(path.name + '.1')
+
+def rotate_requests(offset, request_file=REQUEST_FILE, status_file=STATUS_FILE):
+    """把已处理完的请求文件和状态文件改名为 *.1（覆盖上一次轮转的文件）
+
+    offset 是已处理到的位置；检查之后才追加到旧文件末尾的请求会搬到新的请求文件。
+    轮转后新文件从位置0开始处理
+    """
+    rotated = _rotated_path(request_file)
+    # 持有锁时没有进程在追加请求，改名前后不会丢失请求
+    with _request_lock(request_file):
+        os.replace(request_file, rotated)
+        
+        with open(rotated, 'r+b') as f:
+            f.seek(offset)
+            tail = f.read()
+            # 只搬完整的行
+            tail = tail[:tail.rfind(b'\n') + 1]
+            if tail:
+                with open(request_file, 'ab') as new_file:
+                    new_file.write(tail)
+            # *.1 只保留已处理的请求，搬走的请求不能在重启时被当作已处理（见 load_request_keys）
+            f.truncate(offset)
+    
+    try:
+        os.replace(status_file, _rotated_path(status_file))
+    except FileNotFoundError:
+        pass
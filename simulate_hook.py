@@ -6,21 +6,106 @@
 
 import os
 import sys
-import json
+import re
+import logging
+import logging.handlers
+import pickle
+import shutil
+import signal
 import subprocess
+import tempfile
+import threading
 import time
+import xml.etree.ElementTree as ET
 from pathlib import Path
-from datetime import datetime
 
-def simulate_hook_system():
-    """模拟Hook系统"""
+from merge_queue import append_request, atomic_write, load_json
+
+# svn可执行文件只在启动时查找一次；固定语言环境，输出不随系统区域设置变化。
+# 保留其余环境变量，svn需要通过它们找到认证缓存（APPDATA/HOME）
+SVN_BIN = shutil.which('svn') or 'svn'
+SVN_ENV = dict(os.environ, LC_ALL='C.UTF-8')
+
+# 没有新版本时 svn log -r N:HEAD 返回的错误码
+NO_SUCH_REVISION = 'E160006'
+
+# 检查间隔（秒）：发现新提交后回到最短间隔，连续空闲时逐次翻倍
+MIN_POLL_INTERVAL = 1
+MAX_POLL_INTERVAL = 60
+
+class _BatchedStdoutHandler(logging.handlers.BufferingHandler):
+    """缓存日志记录，flush时合并成一次写入标准输出"""
+    
+    def shouldFlush(self, record):
+        return super().shouldFlush(record) or record.levelno >= logging.ERROR
+    
+    def flush(self):
+        self.acquire()
+        try:
+            if self.buffer:
+                sys.stdout.write(''.join(self.format(record) + '\n' for record in self.buffer))
+                sys.stdout.flush()
+                self.buffer.clear()
+        finally:
+            self.release()
+
+# 单个提交的检查输出先缓存在内存中，检查结束后一次性写出
+logger = logging.getLogger('simulate_hook')
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_buffer = _BatchedStdoutHandler(capacity=64)
+logger.addHandler(_log_buffer)
+
+# 已创建过合并请求的最高版本号；版本号单调递增，记录一个整数即可判断是否重复
+PROCESSED_REVISION_FILE = Path(".processed_revision")
+
+CONFIG_FILE = Path("config.json")
+# 配置解析结果的缓存，按配置文件的修改时间和大小判断是否有效
+CONFIG_CACHE_FILE = Path(".config.cache.pkl")
+
+def load_config(config_file=CONFIG_FILE):
+    """读取配置文件，文件没有变化时直接使用缓存的解析结果"""
+    st = os.stat(config_file)
+    key = (str(config_file), st.st_mtime_ns, st.st_size)
+    
+    try:
+        with open(CONFIG_CACHE_FILE, 'rb') as f:
+            cached_key, config = pickle.load(f)
+        if cached_key == key:
+            return config
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+    
+    config = load_json(config_file)
+    
+    try:
+        with open(CONFIG_CACHE_FILE, 'wb') as f:
+            pickle.dump((key, config), f)
+    except OSError:
+        pass
+    
+    return config
+
+def load_processed_revision():
+    """读取已创建过合并请求的最高版本号"""
+    try:
+        return int(PROCESSED_REVISION_FILE.read_text(encoding='utf-8').strip())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def simulate_hook_system(signal_queue=None, ready_event=None):
+    """模拟Hook系统
+    
+    signal_queue: 与Hook模式运行在同一进程时传入的队列，合并请求直接放入队列，
+    不再写 merge_requests.jsonl
+    ready_event: 获取到初始版本号、开始监控前会被set
+    """
     print("🔧 启动模拟SVN Hook系统...")
     print("=" * 60)
     
     # 读取配置文件
     try:
-        with open("config.json", 'r', encoding='utf-8') as f:
-            config = json.load(f)
+        config = load_config()
         source_branch = config.get('source_branch')
         match_patterns = config.get('match_patterns', {})
         
@@ -31,143 +116,215 @@ def simulate_hook_system():
         print(f"📁 源分支: {source_branch}")
         print(f"📋 匹配规则: {match_patterns}")
         
+        # 匹配规则只在启动时编译一次
+        matcher = compile_patterns(match_patterns)
+        
     except Exception as e:
         print(f"❌ 读取配置文件失败: {e}")
         return
     
     # 获取初始版本号
     try:
-        cmd = ['svn', 'info', source_branch, '--show-item', 'revision']
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        cmd = [SVN_BIN, 'info', source_branch, '--show-item', 'revision']
+        result = subprocess.run(cmd, capture_output=True, env=SVN_ENV)
         
         if result.returncode == 0:
-            last_revision = int(result.stdout.strip())
+            last_revision = int(result.stdout.decode('ascii').strip())
             print(f"📊 初始版本号: {last_revision}")
+            if ready_event is not None:
+                ready_event.set()
         else:
-            print(f"❌ 获取版本号失败: {result.stderr}")
+            print(f"❌ 获取版本号失败: {result.stderr.decode('utf-8', errors='replace')}")
             return
     except Exception as e:
         print(f"❌ 获取版本号时出错: {e}")
         return
     
+    def reload_config(signum, frame):
+        """收到SIGHUP时重新加载匹配规则，无需重启监控"""
+        nonlocal match_patterns, matcher
+        try:
+            match_patterns = load_config().get('match_patterns', {})
+            matcher = compile_patterns(match_patterns)
+            print(f"🔄 匹配规则已重新加载: {match_patterns}")
+        except Exception as e:
+            print(f"❌ 重新加载配置失败: {e}")
+    
+    # Windows没有SIGHUP；信号处理函数只能在主线程中注册
+    if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, reload_config)
+    
     print("\n🔄 开始监控SVN提交...")
     print("💡 按 Ctrl+C 停止监控")
     
+    processed_revision = load_processed_revision()
+    idle_rounds = 0
+    
     try:
         while True:
-            # 检查新版本
+            # 流式读取新提交：svn log 的XML输出边到达边解析，不再每轮调用 svn info
+            found = False
+            # 同一作者连续匹配的提交合并成一个合并请求
+            run = []
             try:
-                cmd = ['svn', 'info', source_branch, '--show-item', 'revision']
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                
-                if result.returncode == 0:
-                    current_revision = int(result.stdout.strip())
+                for commit in iter_new_commits(source_branch, last_revision + 1):
+                    if not found:
+                        found = True
+                        print(f"\n[cyan]{time.strftime('%Y-%m-%d %H:%M:%S')} - 发现新提交![/cyan]")
+                    print(f"📊 版本变化: {last_revision} -> {commit['revision']}")
+                    
+                    if commit['revision'] <= processed_revision:
+                        print(f"⏭️ 提交 {commit['revision']} 已创建过合并请求，跳过")
+                        last_revision = commit['revision']
+                        continue
                     
-                    if current_revision > last_revision:
-                        print(f"\n[cyan]{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 发现新提交![/cyan]")
-                        print(f"📊 版本变化: {last_revision} -> {current_revision}")
-                        
-                        # 检查新提交
-                        for rev in range(last_revision + 1, current_revision + 1):
-                            check_commit(source_branch, rev, match_patterns)
-                        
-                        last_revision = current_revision
+                    matched_rules = check_commit(commit['revision'], commit['author'], commit['message'], matcher)
+                    matches_all = bool(matched_rules) and len(matched_rules) == len(matcher[1])
+                    if run and (not matches_all or run[-1]['author'] != commit['author']):
+                        create_merge_request(run, signal_queue)
+                        run = []
+                    if matches_all:
+                        # 智能体要求提交匹配所有规则，只有各自都匹配所有规则的提交才能合并成一个请求，
+                        # 否则拼接后的提交信息可能匹配单个提交都不匹配的规则组合
+                        run.append(commit)
+                    elif matched_rules:
+                        # 只匹配部分规则的提交单独发送，由智能体判断是否合并
+                        create_merge_request([commit], signal_queue)
+                    last_revision = commit['revision']
                 
             except Exception as e:
                 print(f"❌ 检查版本时出错: {e}")
             
-            time.sleep(5)  # 每5秒检查一次
+            if run:
+                create_merge_request(run, signal_queue)
+            
+            # 日志流结束后等待片刻再重新连接，空闲越久间隔越长
+            idle_rounds = 0 if found else idle_rounds + 1
+            time.sleep(min(MAX_POLL_INTERVAL, MIN_POLL_INTERVAL * 2 ** min(idle_rounds, 6)))
             
     except KeyboardInterrupt:
         print("\n[yellow]监控已停止[/yellow]")
 
-def check_commit(source_branch, revision, match_patterns):
-    """检查单个提交"""
+def iter_new_commits(source_branch, start_revision):
+    """流式获取 start_revision 及之后的提交（一次 svn log 取回整个版本范围）"""
+    cmd = [SVN_BIN, 'log', source_branch, '-r', f'{start_revision}:HEAD', '--xml']
+    # stderr写到临时文件，避免读stdout时stderr管道写满造成死锁
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, env=SVN_ENV)
+        try:
+            for _, elem in ET.iterparse(proc.stdout, events=('end',)):
+                if elem.tag == 'logentry':
+                    commit = {
+                        'revision': int(elem.get('revision')),
+                        'author': elem.findtext('author', ''),
+                        'message': elem.findtext('msg', '').strip()
+                    }
+                    # 先释放元素再交给调用方处理
+                    elem.clear()
+                    yield commit
+        except ET.ParseError:
+            # 出错时svn不输出完整的XML，错误信息在下面从stderr读取
+            pass
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode('utf-8', errors='replace')
+    
+    if proc.returncode != 0 and NO_SUCH_REVISION not in stderr:
+        raise RuntimeError(f"获取提交日志失败: {stderr.strip()}")
+
+# 按编号引用分组的写法（\1、(?(1)...)）：规则合并后分组重新编号，引用会指向别的分组
+_NUMBERED_GROUP_REF_RE = re.compile(r'\\[1-9]|\(\?\(\d')
+
+def compile_patterns(match_patterns):
+    """把所有匹配规则合并成一个带命名分组的正则，一次扫描即可得到全部命中的规则
+    
+    返回 (combined, rule_names, patterns)，rule_names 把分组名映射回配置中的规则名。
+    单独能编译的规则合并后不一定能编译（如以(?i)开头、分组重名），按编号的反向引用合并后
+    仍能编译但含义改变，这两种情况下 combined 为None，按 patterns（分组名 -> 单条规则的正则）逐条匹配
+    """
+    rule_names = {}
+    patterns = {}
+    alternatives = []
+    for i, (name, pattern) in enumerate(match_patterns.items()):
+        # 规则名不一定是合法的分组名，统一用序号命名
+        group = f"rule{i}"
+        rule_names[group] = name
+        patterns[group] = re.compile(pattern, re.IGNORECASE)
+        alternatives.append(f"(?P<{group}>{pattern})")
+    
+    combined = None
+    if not any(_NUMBERED_GROUP_REF_RE.search(pattern) for pattern in match_patterns.values()):
+        try:
+            # 没有规则时使用一个永远不匹配的正则
+            combined = re.compile('|'.join(alternatives) or r'(?!)', re.IGNORECASE)
+        except re.error:
+            pass
+    return combined, rule_names, patterns
+
+def check_commit(revision, author, commit_message, matcher):
+    """检查单个提交，返回匹配的规则名列表（不匹配任何规则时为空列表）"""
     try:
-        # 获取提交信息
-        cmd = ['svn', 'log', source_branch, '-r', str(revision), '--xml']
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            print(f"❌ 获取提交 {revision} 信息失败")
-            return
-        
-        # 解析提交信息
-        import re
-        msg_pattern = r'<msg>(.*?)</msg>'
-        author_pattern = r'<author>(.*?)</author>'
-        
-        messages = re.findall(msg_pattern, result.stdout, re.DOTALL)
-        authors = re.findall(author_pattern, result.stdout)
-        
-        if not messages or not authors:
-            print(f"❌ 无法解析提交 {revision} 信息")
-            return
-        
-        commit_message = messages[0].strip()
-        author = authors[0]
-        
-        print(f"📝 提交 {revision}: {author} - {commit_message[:50]}...")
+        logger.info(f"📝 提交 {revision}: {author} - {commit_message[:50]}...")
         
         # 检查匹配规则
-        should_merge = False
-        matched_rules = []
-        for pattern_name, pattern in match_patterns.items():
-            if re.search(pattern, commit_message, re.IGNORECASE):
-                should_merge = True
-                matched_rules.append(pattern_name)
-        
-        if should_merge:
-            print(f"✅ 提交 {revision} 匹配规则: {matched_rules}")
-            print(f"🎯 触发自动合并...")
-            
-            # 创建合并请求
-            create_merge_request(revision, author, commit_message)
+        combined, rule_names, patterns = matcher
+        if combined is not None:
+            hits = {m.lastgroup for m in combined.finditer(commit_message)}
         else:
-            print(f"❌ 提交 {revision} 不匹配任何规则")
+            hits = {group for group, pattern in patterns.items() if pattern.search(commit_message)}
+        matched_rules = [name for group, name in rule_names.items() if group in hits]
+        
+        if matched_rules:
+            logger.info(f"✅ 提交 {revision} 匹配规则: {matched_rules}")
+            return matched_rules
+        
+        logger.info(f"❌ 提交 {revision} 不匹配任何规则")
+        return []
             
     except Exception as e:
-        print(f"❌ 检查提交 {revision} 时出错: {e}")
+        logger.error(f"❌ 检查提交 {revision} 时出错: {e}")
+        return []
+    finally:
+        _log_buffer.flush()
 
-def create_merge_request(revision, author, commit_message):
-    """创建合并请求"""
+def create_merge_request(commits, signal_queue=None):
+    """为同一作者连续匹配的一组提交创建一个合并请求"""
+    revisions = [commit['revision'] for commit in commits]
     try:
+        logger.info(f"🎯 触发自动合并: 版本 {', '.join(map(str, revisions))}")
+        
         merge_request = {
-            "revision": revision,
-            "author": author,
-            "message": commit_message,
+            "revision": revisions[-1],
+            "revisions": revisions,
+            "author": commits[0]['author'],
+            "message": '\n'.join(commit['message'] for commit in commits),
             "timestamp": time.time(),
             "status": "pending"
         }
         
-        # 保存到文件
-        request_file = Path("merge_requests.json")
-        requests = []
-        
-        if request_file.exists():
-            try:
-                with open(request_file, 'r', encoding='utf-8') as f:
-                    requests = json.load(f)
-            except:
-                requests = []
-        
-        requests.append(merge_request)
-        
-        with open(request_file, 'w', encoding='utf-8') as f:
-            json.dump(requests, f, indent=2, ensure_ascii=False)
-        
-        print(f"📄 合并请求已保存: 版本 {revision}")
+        if signal_queue is not None:
+            # 同一进程内直接把请求交给Hook模式，由Hook模式负责保存
+            signal_queue.put_nowait(merge_request)
+        else:
+            # 追加到请求队列文件，Hook模式监听文件变化
+            append_request(merge_request)
         
-        # 创建信号文件
-        signal_file = Path("hook_signal.txt")
-        signal_file.write_text(str(time.time()), encoding='utf-8')
-        print(f"📡 信号已发送")
+        atomic_write(PROCESSED_REVISION_FILE, str(revisions[-1]).encode('utf-8'))
+        logger.info(f"📄 合并请求已创建: 版本 {', '.join(map(str, revisions))}")
+        logger.info("📡 已放入Hook模式的请求队列" if signal_queue is not None else "📡 已追加到合并请求文件")
         
     except Exception as e:
-        print(f"❌ 创建合并请求失败: {e}")
+        logger.error(f"❌ 创建合并请求失败: {e}")
+    finally:
+        _log_buffer.flush()
 
 def main():
     """主函数"""
+    # 单独运行时降低监控进程的优先级（Windows没有os.nice）
+    if hasattr(os, 'nice'):
+        os.nice(10)
     simulate_hook_system()
 
 if __name__ == "__main__":
@@ -1,28 +1,31 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-启动Hook系统 - 同时启动模拟Hook监控和Hook模式
+启动Hook系统 - 在同一进程中启动模拟Hook监控和Hook模式
 """
 
-import subprocess
-import sys
-import time
+import os
+import queue
 import threading
-from pathlib import Path
 
-def start_simulate_hook():
+def start_simulate_hook(signal_queue, ready_event):
     """启动模拟Hook监控"""
     print("🔄 启动模拟Hook监控...")
     try:
-        subprocess.run([sys.executable, 'simulate_hook.py'])
+        from simulate_hook import simulate_hook_system
+        simulate_hook_system(signal_queue, ready_event)
     except Exception as e:
         print(f"❌ 模拟Hook监控启动失败: {e}")
+    finally:
+        # 启动失败时也要放行主线程
+        ready_event.set()
 
-def start_hook_mode():
+def start_hook_mode(signal_queue):
     """启动Hook模式"""
     print("🔄 启动Hook模式...")
     try:
-        subprocess.run([sys.executable, 'svn_auto_merge.py', '--hook'])
+        from svn_auto_merge import SVNAgent
+        SVNAgent().hook_mode(signal_queue)
     except Exception as e:
         print(f"❌ Hook模式启动失败: {e}")
 
@@ -32,28 +35,33 @@ def main():
     print("=" * 60)
     
     # 检查必要文件
-    required_files = ['simulate_hook.py', 'svn_auto_merge.py', 'config.json']
-    for file in required_files:
-        if not Path(file).exists():
-            print(f"❌ 缺少必要文件: {file}")
-            return
+    required_files = ['simulate_hook.py', 'svn_auto_merge.py', 'merge_queue.py', 'config.json']
+    present = {entry.name for entry in os.scandir('.')}
+    missing = [file for file in required_files if file not in present]
+    if missing:
+        print(f"❌ 缺少必要文件: {', '.join(missing)}")
+        return
     
     print("✅ 所有必要文件检查完成")
     
+    # 两者之间通过内存队列传递Hook信号
+    signal_queue = queue.Queue()
+    
     # 启动模拟Hook监控（后台线程）
     print("\n🔄 启动模拟Hook监控（后台）...")
-    hook_thread = threading.Thread(target=start_simulate_hook, daemon=True)
+    ready_event = threading.Event()
+    hook_thread = threading.Thread(target=start_simulate_hook, args=(signal_queue, ready_event), daemon=True)
     hook_thread.start()
     
-    # 等待一下让模拟Hook启动
-    time.sleep(2)
+    # 等待模拟Hook获取到初始版本号
+    ready_event.wait()
     
     # 启动Hook模式（主线程）
     print("🔄 启动Hook模式（前台）...")
     print("💡 按 Ctrl+C 停止整个系统")
     
     try:
-        start_hook_mode()
+        start_hook_mode(signal_queue)
     except KeyboardInterrupt:
         print("\n🛑 系统已停止")
 
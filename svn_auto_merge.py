@@ -7,74 +7,306 @@ SVN自动合并智能体工具
 
 import os
 import sys
-import json
+import locale
 import re
 import subprocess
+import tempfile
 import logging
+import logging.handlers
 import argparse
+import atexit
+import functools
+import queue
+import signal
+import socket
+import threading
 import time
+import xml.etree.ElementTree as ET
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 第三方库
-import requests
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from rich.prompt import Prompt, Confirm
-from rich.logging import RichHandler
-from dotenv import load_dotenv
 
-# 加载环境变量
-load_dotenv()
+# 可选：安装了pysvn时在进程内直接调用libsvn，认证和连接可以复用
+try:
+    import pysvn
+except ImportError:
+    pysvn = None
 
-console = Console()
+from merge_queue import (
+    REQUEST_FILE, ROTATE_SIZE, append_request, atomic_write, append_status, dump_json, hook_address, load_json,
+    load_offset, load_request_keys, read_new_requests, request_key, rotate_requests, save_offset
+)
 
-@dataclass
+@functools.lru_cache(maxsize=1)
+def _get_console():
+    """第一次输出时才导入rich并创建Console"""
+    from rich.console import Console
+    return Console()
+
+class _LazyConsole:
+    """模块级的console，属性访问转发给 _get_console() 创建的Console"""
+    def __getattr__(self, name):
+        return getattr(_get_console(), name)
+
+console = _LazyConsole()
+
+class _LazyRichHandler(logging.Handler):
+    """控制台日志处理器，第一次输出日志时才导入rich并创建RichHandler
+    
+    日志由QueueListener的后台线程输出，创建SVNAgent时不需要导入rich
+    """
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self._handler = None
+    
+    def emit(self, record):
+        if self._handler is None:
+            from rich.logging import RichHandler
+            self._handler = RichHandler(console=_get_console(), show_time=True)
+        self._handler.handle(record)
+
+# 使用文件监听时Hook模式的最长等待时间（秒）
+HOOK_HEARTBEAT_SECONDS = 30
+# svn merge 输出中文件状态行: A=添加, M=修改, D=删除, C=冲突, G=合并
+_MERGE_LINE_RE = re.compile(rb'^[ \t]*[AMDCG][ \t]+(\S.*?)[ \t\r]*$', re.MULTILINE)
+
+def _decode_output(data: bytes) -> str:
+    """解码svn输出中需要显示或保存的部分（svn按系统区域设置的编码输出）"""
+    return data.decode(locale.getpreferredencoding(False), 'replace')
+
+def _find_output_line(output: bytes, marker: bytes) -> Optional[str]:
+    """返回svn输出中第一个包含marker的行，没有时返回None"""
+    pos = output.find(marker)
+    if pos == -1:
+        return None
+    start = output.rfind(b'\n', 0, pos) + 1
+    end = output.find(b'\n', pos)
+    if end == -1:
+        end = len(output)
+    return _decode_output(output[start:end]).strip()
+
+# 已判断过的提交是否需要合并，重启和重试时不再重新匹配
+MATCH_CACHE_FILE = Path("logs/match_cache.json")
+# 缓存新增多少条结果后写一次文件
+MATCH_CACHE_FLUSH_EVERY = 50
+# 缓存文件最多保留的结果数，超出时丢弃最早的版本
+MATCH_CACHE_MAX_ENTRIES = 10000
+
+# 按编号引用分组的写法（\1、(?(1)...)）：规则合并后分组重新编号，引用会指向别的分组
+_NUMBERED_GROUP_REF_RE = re.compile(r'\\[1-9]|\(\?\(\d')
+
+# 不代表字面量的转义：字符类和 \b \A 等位置断言
+_CLASS_ESCAPES = frozenset('dDwWsSbBAZ')
+# 行内标志 (?aiLmsux-imsx:...)，如 (?x) 会让空格不再是字面量
+_INLINE_FLAGS = frozenset('aiLmsux-')
+
+def _longest_literal(pattern: str) -> Optional[str]:
+    """提取正则中必定出现的最长字面量，无法确定时返回None
+    
+    只考虑最外层的字面量：分组和字符类内部的内容不一定出现，最外层有 | 时无法确定。
+    含有 \x41、\u4e2d、\1 这类转义或 (?x) 这类行内标志时，字面量和正则的写法不一致，也返回None
+    """
+    runs = []
+    current = ''
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == '\\' and i + 1 < len(pattern):
+            nxt = pattern[i + 1]
+            i += 2
+            if nxt.isalnum() and nxt not in _CLASS_ESCAPES:
+                return None
+            if depth == 0 and not nxt.isalnum():
+                # 转义的标点是字面量，如 \.
+                current += nxt
+                continue
+            # \d \w 等字符类
+            runs.append(current)
+            current = ''
+            continue
+        if ch == '[':
+            # 跳过字符类
+            runs.append(current)
+            current = ''
+            i += 1
+            # [^...] 和紧跟在 [ 或 [^ 之后的 ] 都属于字符类本身，如 []x] [^]x]
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+            continue
+        if ch in '*?{':
+            # 前一个字符是可选/重复的，不计入字面量
+            current = current[:-1]
+            runs.append(current)
+            current = ''
+            if ch == '{':
+                end = pattern.find('}', i)
+                i = end if end != -1 else len(pattern)
+        elif ch == '+':
+            runs.append(current)
+            current = ''
+        elif ch == '(':
+            if pattern[i + 1:i + 2] == '?' and pattern[i + 2:i + 3] in _INLINE_FLAGS:
+                return None
+            runs.append(current)
+            current = ''
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == '|':
+            if depth == 0:
+                return None
+        elif ch in '.^$':
+            runs.append(current)
+            current = ''
+        elif depth == 0:
+            current += ch
+        i += 1
+    runs.append(current)
+    longest = max(runs, key=len)
+    return longest or None
+
+# dataclass的slots参数需要Python 3.10+，更早的版本仍使用普通的实例字典
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(frozen=True, **_DATACLASS_SLOTS)
 class CommitInfo:
-    """提交信息数据类"""
+    """提交信息数据类（不可变，可以作为缓存的键）"""
     revision: str
     author: str
     date: str
     message: str
-    files: List[str]
+    files: Tuple[str, ...]
 
-@dataclass
+@dataclass(frozen=True, **_DATACLASS_SLOTS)
 class MergeResult:
-    """合并结果数据类"""
+    """合并结果数据类（不可变）"""
     success: bool
     revision: str
     message: str
-    conflicts: List[str]
+    conflicts: Tuple[str, ...]
     error: Optional[str] = None
 
 class SVNAgent:
     """SVN自动合并智能体"""
     
-    def __init__(self, config_path: str = "config.json"):
-        """初始化智能体"""
+    def __init__(self, config_path: str = "config.json", verbose: bool = False):
+        """初始化智能体
+        
+        verbose: 在控制台输出DEBUG级别的日志（包括空闲轮询的状态）
+        """
+        # 加载环境变量
+        from dotenv import load_dotenv
+        load_dotenv()
+        
+        self.verbose = verbose
         self.config = self._load_config(config_path)
+        self._compiled_patterns = self._compile_patterns()
+        self._union_pattern = self._compile_union_pattern()
+        self._search_args = self._build_search_args()
+        self._prefilter_literals = self._build_prefilter_literals()
         self.logger = self._setup_logger()
         self.last_checked_revision = self._load_last_revision()
+        # 还没有写入文件的检查版本号，空闲或退出时才写入
+        self._pending_revision: Optional[int] = None
+        atexit.register(self._flush_last_revision)
+        # 运行模式由入口方法设置，None表示未知（外部直接调用时才检查文件）
+        self._hook_mode: Optional[bool] = None
+        self._svn_client = pysvn.Client() if pysvn is not None else None
+        # 已处理到的合并请求文件位置，只读取之后新追加的请求
+        self._processed_offset = load_offset()
+        # 已处理请求的 (版本号, 仓库)，Hook重试等产生的重复请求不再合并
+        self._seen_requests = load_request_keys(self._processed_offset)
+        # 合并请求文件保持打开，每次只seek到处理位置读取，不重复打开文件
+        self._mr_fp = None
+        # Hook通知到达时唤醒轮询，不必等到下一个检查间隔
+        self._wake = threading.Event()
+        # 查询提交信息失败、等待重试的Hook通知（版本号 -> 仓库路径）
+        self._failed_hook_revisions: Dict[int, str] = {}
+        # 合并在线程池中执行，同一目标分支的工作副本同时只允许一个合并
+        self._pool = ThreadPoolExecutor(max_workers=self.config.get('max_parallel', 2))
+        # 停止Hook模式时设置，线程池中的合并不再开始下一个提交
+        self._stop_merges = threading.Event()
+        self._branch_locks: Dict[str, threading.Lock] = {}
+        self._branch_locks_guard = threading.Lock()
+        self._match_cache = self._load_match_cache()
+        self._match_cache_unsaved = 0
+        atexit.register(self._flush_match_cache)
         
     def _load_config(self, config_path: str) -> Dict:
         """加载配置文件"""
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return load_json(config_path)
         except FileNotFoundError:
             console.print(f"[red]错误: 配置文件 {config_path} 不存在[/red]")
             sys.exit(1)
-        except json.JSONDecodeError as e:
+        except ValueError as e:  # json和orjson的解析错误都是ValueError
             console.print(f"[red]错误: 配置文件格式错误 - {e}[/red]")
             sys.exit(1)
     
+    def _compile_patterns(self) -> List[Tuple[str, re.Pattern]]:
+        """编译匹配规则，每个规则只在加载配置时编译一次"""
+        return [
+            (name, re.compile(pattern, re.IGNORECASE))
+            for name, pattern in self.config.get('match_patterns', {}).items()
+        ]
+    
+    def _compile_union_pattern(self) -> Optional[re.Pattern]:
+        """把所有规则合并成一个带命名分组的正则，第i条规则对应分组 rule{i}
+        
+        单独能编译的规则合并后不一定能编译（如以(?i)开头、分组重名），按编号的反向引用合并后
+        仍能编译但含义改变，这两种情况都返回None，逐条规则匹配
+        """
+        if any(_NUMBERED_GROUP_REF_RE.search(pattern.pattern) for _, pattern in self._compiled_patterns):
+            return None
+        alternatives = [
+            f"(?P<rule{i}>{pattern.pattern})"
+            for i, (_, pattern) in enumerate(self._compiled_patterns)
+        ]
+        try:
+            # 没有规则时使用一个永远不匹配的正则
+            return re.compile('|'.join(alternatives) or r'(?!)', re.IGNORECASE)
+        except re.error:
+            return None
+    
+    def _build_prefilter_literals(self) -> Tuple[str, ...]:
+        """每条规则必定包含的字面量（casefold后），用于在正则匹配前快速排除提交
+        
+        提取不出字面量的规则不参与预筛选
+        """
+        literals = (_longest_literal(pattern.pattern) for _, pattern in self._compiled_patterns)
+        return tuple(literal.casefold() for literal in literals if literal)
+    
+    def _build_search_args(self) -> List[str]:
+        """为 svn log 生成 --search 参数，让svn只返回包含所有规则字面量的提交
+        
+        有规则提取不出字面量时返回空列表，获取完整日志
+        """
+        literals = [_longest_literal(pattern.pattern) for _, pattern in self._compiled_patterns]
+        if not literals or None in literals:
+            return []
+        
+        args = []
+        for i, literal in enumerate(literals):
+            # --search 使用glob语法（apr_fnmatch），转义其中的通配符和反斜杠
+            glob = ''.join('\\\\' if ch == '\\' else f'[{ch}]' if ch in '*?[' else ch for ch in literal)
+            args += ['--search' if i == 0 else '--search-and', glob]
+        return args
+    
     def _setup_logger(self) -> logging.Logger:
         """设置日志记录器"""
         logger = logging.getLogger('svn_auto_merge')
-        logger.setLevel(logging.INFO)
+        console_level = logging.DEBUG if self.verbose else logging.INFO
+        logger.setLevel(console_level)
         
         # 创建日志目录
         log_dir = Path(self.config.get('log_file', 'logs/merge.log')).parent
@@ -88,8 +320,7 @@ class SVNAgent:
         file_handler.setLevel(logging.INFO)
         
         # 控制台处理器
-        console_handler = RichHandler(console=console, show_time=True)
-        console_handler.setLevel(logging.INFO)
+        console_handler = _LazyRichHandler(console_level)
         
         # 格式化器
         formatter = logging.Formatter(
@@ -97,45 +328,87 @@ class SVNAgent:
         )
         file_handler.setFormatter(formatter)
         
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        # 记录日志时只放入队列，由后台线程格式化并写入文件和控制台，不阻塞合并流程
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(
+            log_queue, file_handler, console_handler, respect_handler_level=True
+        )
+        listener.start()
+        # 退出时写完队列中剩余的日志（atexit按注册的相反顺序执行，其他退出处理的日志也能写入）
+        atexit.register(listener.stop)
+        
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
         
         return logger
     
     def _load_last_revision(self) -> int:
         """加载上次检查的版本号"""
-        state_file = Path("logs/last_revision.txt")
-        if state_file.exists():
-            try:
-                return int(state_file.read_text(encoding='utf-8').strip())
-            except:
-                return 0
-        return 0
+        # 直接打开文件，文件不存在时捕获异常，不需要先检查是否存在
+        try:
+            with open("logs/last_revision.txt", 'rb') as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
     
-    def _save_last_revision(self, revision: int):
-        """保存最后检查的版本号"""
-        state_file = Path("logs/last_revision.txt")
-        state_file.parent.mkdir(exist_ok=True)
-        state_file.write_text(str(revision), encoding='utf-8')
+    def _match_rules(self) -> List[List[str]]:
+        """当前的匹配规则，规则变化后缓存的结果不再有效"""
+        return [[name, pattern.pattern] for name, pattern in self._compiled_patterns]
+    
+    def _load_match_cache(self) -> Dict[str, bool]:
+        """加载匹配结果缓存，规则或源分支与当前配置不同时丢弃"""
+        try:
+            data = load_json(MATCH_CACHE_FILE)
+        except (FileNotFoundError, ValueError):
+            return {}
+        if data.get('rules') != self._match_rules() or data.get('source_branch') != self.config.get('source_branch'):
+            return {}
+        return data.get('results', {})
+    
+    def _flush_match_cache(self):
+        """保存匹配结果缓存"""
+        if not self._match_cache_unsaved:
+            return
+        results = self._match_cache
+        if len(results) > MATCH_CACHE_MAX_ENTRIES:
+            # 版本号递增，只保留最近的结果
+            keys = sorted(results, key=lambda key: int(key.split('|', 1)[0].rsplit(',', 1)[-1]))
+            results = self._match_cache = {key: results[key] for key in keys[-MATCH_CACHE_MAX_ENTRIES:]}
+        data = {'rules': self._match_rules(), 'source_branch': self.config.get('source_branch'), 'results': results}
+        MATCH_CACHE_FILE.parent.mkdir(exist_ok=True)
+        atomic_write(MATCH_CACHE_FILE, dump_json(data))
+        self._match_cache_unsaved = 0
     
     def check_commit_message(self, message: str) -> Tuple[bool, Dict[str, str]]:
         """检查提交信息是否匹配规则"""
-        patterns = self.config.get('match_patterns', {})
         matches = {}
         
-        for key, pattern in patterns.items():
-            match = re.search(pattern, message)
-            if match:
-                matches[key] = match.group(1) if match.groups() else match.group(0)
+        # 用合并后的正则扫描一遍消息，每条规则取第一次匹配
+        for m in self._union_pattern.finditer(message) if self._union_pattern is not None else ():
+            i = int(m.lastgroup[len('rule'):])
+            key, pattern = self._compiled_patterns[i]
+            if key not in matches:
+                # 规则自己的第一个分组紧跟在外层命名分组之后
+                group = self._union_pattern.groupindex[m.lastgroup]
+                matches[key] = m.group(group + 1) if pattern.groups else m.group(group)
+        
+        # 匹配位置重叠的规则可能在一次扫描中被遮住，只对这些规则单独再检查
+        for key, pattern in self._compiled_patterns:
+            if key not in matches:
+                match = pattern.search(message)
+                if match:
+                    matches[key] = match.group(1) if match.groups() else match.group(0)
         
         # 必须同时满足所有条件
-        required_keys = set(patterns.keys())
+        required_keys = {key for key, _ in self._compiled_patterns}
         found_keys = set(matches.keys())
         
         return required_keys.issubset(found_keys), matches
     
     def interactive_mode(self):
         """交互式模式"""
+        from rich.panel import Panel
+        from rich.prompt import Prompt
+        self._hook_mode = False
         console.print(Panel.fit(
             "[bold blue]SVN自动合并智能体[/bold blue]\n"
             "支持智能冲突分析和自然语言配置",
@@ -161,6 +434,8 @@ class SVNAgent:
     
     def auto_start_mode(self):
         """自动启动模式：立即检查并进入轮询"""
+        from rich.panel import Panel
+        self._hook_mode = False
         console.print(Panel(
             "[bold blue]SVN自动合并智能体[/bold blue]\n"
             "自动启动模式 - 只检查启动后的新提交",
@@ -179,16 +454,30 @@ class SVNAgent:
         console.print(f"[yellow]进入轮询模式，检查间隔: {self.config.get('check_interval', 300)}秒[/yellow]")
         console.print("[dim]只检查启动后的新提交，按 Ctrl+C 停止轮询[/dim]")
         
+        # Hook脚本通知新提交时立即检查，没有通知时最多等待一个检查间隔
+        close_listener = self._start_hook_listener()
         try:
             while True:
-                time.sleep(self.config.get('check_interval', 300))
-                console.print(f"\n[cyan]{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 执行定期检查...[/cyan]")
+                if self._wake.wait(timeout=self.config.get('check_interval', 300)):
+                    self.logger.debug("收到Hook通知，执行检查")
+                else:
+                    self.logger.debug("执行定期检查")
+                self._wake.clear()
                 self.check_new_commits()
         except KeyboardInterrupt:
             console.print("\n[yellow]轮询已停止[/yellow]")
+        finally:
+            if close_listener is not None:
+                close_listener()
     
-    def hook_mode(self):
-        """Hook模式：监听SVN hook信号"""
+    def hook_mode(self, signal_queue: Optional[queue.Queue] = None):
+        """Hook模式：监听SVN hook信号
+        
+        signal_queue: 模拟Hook运行在同一进程时传入，合并请求通过队列送达而不是信号文件
+        """
+        from rich.panel import Panel
+        self._hook_mode = True
+        
         console.print(Panel(
             "[bold blue]SVN自动合并智能体[/bold blue]\n"
             "Hook模式 - 实时监听SVN提交",
@@ -207,89 +496,320 @@ class SVNAgent:
         console.print("[yellow]进入Hook监听模式[/yellow]")
         console.print("[dim]监听SVN hook信号，按 Ctrl+C 停止监听[/dim]")
         
-        signal_file = Path("hook_signal.txt")
-        last_signal_time = 0
+        # 进程内的合并请求和文件变化事件都汇总到同一个队列
+        events = signal_queue if signal_queue is not None else queue.Queue()
+        observer = self._start_request_watcher(events)
+        close_listener = self._start_hook_listener(events)
+        # 有文件监听时只需定期醒来，否则退回到每秒检查一次请求文件
+        timeout = HOOK_HEARTBEAT_SECONDS if observer is not None else 1
         
         try:
+            # 处理启动前已写入的请求（智能体停止期间Hook脚本追加的请求、监听开始前追加的请求）
+            self._check_merge_requests()
             while True:
-                # 检查hook信号文件
-                if signal_file.exists():
+                try:
+                    batch = [events.get(timeout=timeout)]
+                except queue.Empty:
+                    self._flush_last_revision()
+                    # 上次查询失败的Hook通知在醒来时重试
+                    if self._failed_hook_revisions:
+                        self._queue_hook_revisions({})
+                    # 文件监听可能漏掉事件，醒来时仍比较文件大小和处理位置
+                    self._check_merge_requests()
+                    continue
+                
+                # 一次取完已到达的事件，连续的写入只处理一次
+                while True:
                     try:
-                        signal_time = float(signal_file.read_text(encoding='utf-8').strip())
-                        if signal_time > last_signal_time:
-                            last_signal_time = signal_time
-                            console.print(f"\n[cyan]{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 收到Hook信号[/cyan]")
-                            self._process_hook_requests()
-                    except:
-                        pass
+                        batch.append(events.get_nowait())
+                    except queue.Empty:
+                        break
                 
-                # 检查合并请求文件
-                self._check_merge_requests()
+                hook_revisions = {}
+                for event in batch:
+                    if isinstance(event, dict):
+                        # 进程内模拟Hook送来的合并请求，先保存，处理中断后重启仍能继续处理
+                        if request_key(event) not in self._seen_requests:
+                            append_request(event)
+                    elif isinstance(event, tuple):
+                        # Hook脚本通过socket通知的 (仓库路径, 版本号)
+                        hook_revisions[event[1]] = event[0]
+                if hook_revisions or self._failed_hook_revisions:
+                    self._queue_hook_revisions(hook_revisions)
                 
-                time.sleep(1)  # 1秒检查一次
+                self.logger.debug(f"收到 {len(batch)} 个Hook事件")
+                self._process_hook_requests()
                 
         except KeyboardInterrupt:
             console.print("\n[yellow]Hook监听已停止[/yellow]")
+        finally:
+            # 正在进行的合并执行完当前提交后停止，排队中的合并任务不再执行
+            self._stop_merges.set()
+            if sys.version_info >= (3, 9):
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            else:
+                self._pool.shutdown(wait=False)
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            if close_listener is not None:
+                close_listener()
+            self._close_request_file()
+    
+    def _start_hook_listener(self, events: Optional[queue.Queue] = None):
+        """监听Hook脚本的连接，收到的每行 "仓库路径\t版本号" 作为事件放入队列，并唤醒轮询
+        
+        events 为None时（轮询模式）只设置 self._wake，由轮询检查新提交。
+        返回停止监听的函数；无法监听时返回None，Hook脚本会退回到写请求文件
+        """
+        family, address = hook_address()
+        if family != socket.AF_INET and self._hook_socket_in_use(address):
+            console.print(f"[yellow]已有智能体在监听Hook通知 {address}[/yellow]")
+            return None
+        server = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            server.bind(address)
+            server.listen()
+        except OSError as e:
+            server.close()
+            console.print(f"[yellow]无法监听Hook通知 {address}: {e}[/yellow]")
+            return None
+        
+        stop = threading.Event()
+        
+        def serve():
+            while True:
+                # 阻塞等待连接，停止时关闭监听socket让accept返回
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    if stop.is_set():
+                        return
+                    continue
+                data = b''
+                with conn:
+                    conn.settimeout(1)
+                    try:
+                        while True:
+                            chunk = conn.recv(4096)
+                            if not chunk:
+                                break
+                            data += chunk
+                    except OSError:
+                        pass
+                for line in data.decode('utf-8', 'replace').splitlines():
+                    repository_path, _, revision = line.partition('\t')
+                    if revision.strip().isdigit():
+                        if events is not None:
+                            events.put((repository_path, int(revision)))
+                        self._wake.set()
+        
+        thread = threading.Thread(target=serve, name='hook-listener', daemon=True)
+        thread.start()
+        self.logger.debug(f"监听Hook通知: {address}")
+        
+        def close():
+            stop.set()
+            try:
+                # 只close不能让Linux上阻塞的accept返回
+                server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            server.close()
+            thread.join()
+            if family != socket.AF_INET:
+                try:
+                    os.unlink(address)
+                except FileNotFoundError:
+                    pass
+        
+        return close
+    
+    def _hook_socket_in_use(self, address: str) -> bool:
+        """socket文件是否属于正在运行的智能体；上次异常退出留下的socket文件会被删除"""
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(address)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError:
+            # 没有进程监听（拒绝连接），清理残留的socket文件
+            try:
+                os.unlink(address)
+            except FileNotFoundError:
+                pass
+            return False
+        finally:
+            probe.close()
+    
+    def _queue_hook_revisions(self, revisions: Dict[int, str]):
+        """查询Hook通知的版本（版本号 -> 仓库路径），匹配规则时写入合并请求
+        
+        Hook脚本通知成功后不再记录该版本，查询失败的版本保存在 self._failed_hook_revisions 中，
+        下次收到通知或醒来时重试
+        """
+        source_branch = self.config.get('source_branch')
+        if not source_branch:
+            return
+        revisions = {**self._failed_hook_revisions, **revisions}
+        # 同一批通知的版本用一次范围查询取回，不逐个版本调用svn log；
+        # 版本没有修改源分支时svn log不返回该版本
+        try:
+            commits = self._fetch_commits_info(source_branch, min(revisions) - 1, max(revisions))
+        except Exception as e:
+            self._failed_hook_revisions = revisions
+            console.print(f"[red]获取Hook通知的提交信息失败，稍后重试: {e}[/red]")
+            self.logger.error(f"获取Hook通知的提交信息失败，稍后重试: {e}")
+            return
+        self._failed_hook_revisions = {}
+        for commit in commits:
+            if commit['revision'] not in revisions:
+                continue
+            repository = commit['repository'] = revisions[commit['revision']]
+            if (commit['revision'], repository) in self._seen_requests or not self._should_merge(commit):
+                continue
+            append_request({
+                'revision': commit['revision'],
+                'repository': repository,
+                'revisions': [commit['revision']],
+                'author': commit['author'],
+                'message': commit['message'],
+                'timestamp': time.time(),
+                'status': 'pending'
+            })
+    
+    def _start_request_watcher(self, events: queue.Queue):
+        """监听合并请求文件的变化，有变化时向队列发送事件
+        
+        没有安装watchdog时返回None，由调用方退回到轮询
+        """
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import PatternMatchingEventHandler
+        except ImportError:
+            console.print("[dim]未安装watchdog，使用轮询方式检查合并请求文件[/dim]")
+            return None
+        
+        class RequestFileHandler(PatternMatchingEventHandler):
+            def on_created(self, event):
+                events.put(event.src_path)
+            
+            def on_modified(self, event):
+                events.put(event.src_path)
+            
+            def on_moved(self, event):
+                events.put(event.dest_path)
+        
+        handler = RequestFileHandler(
+            patterns=[f"*{REQUEST_FILE.name}"],
+            ignore_directories=True
+        )
+        observer = Observer()
+        observer.schedule(handler, str(REQUEST_FILE.resolve().parent), recursive=False)
+        observer.start()
+        return observer
     
     def _process_hook_requests(self):
-        """处理Hook请求"""
+        """处理Hook请求，只读取上次处理位置之后新追加的请求"""
         try:
-            request_file = Path("merge_requests.json")
-            if not request_file.exists():
-                console.print("[dim]没有找到合并请求文件[/dim]")
+            try:
+                file_stat = REQUEST_FILE.stat()
+            except FileNotFoundError:
+                self.logger.debug("没有找到合并请求文件")
+                self._close_request_file()
+                return
+            file_size = file_stat.st_size
+            
+            if self._mr_fp is not None and not os.path.samestat(os.fstat(self._mr_fp.fileno()), file_stat):
+                # 请求文件被替换，重新打开并从头读取
+                self.logger.info("合并请求文件已被替换，从头开始读取")
+                self._close_request_file()
+                self._processed_offset = 0
+            if file_size < self._processed_offset:
+                # 请求文件被替换或截断，从头开始读取
+                self.logger.info("合并请求文件变小，从头开始读取")
+                self._processed_offset = 0
+            if file_size == self._processed_offset:
+                self.logger.debug("没有新的合并请求")
                 return
             
-            with open(request_file, 'r', encoding='utf-8') as f:
-                requests = json.load(f)
+            if self._mr_fp is None:
+                self._mr_fp = open(REQUEST_FILE, 'rb')
+            entries, end_offset = read_new_requests(self._mr_fp, self._processed_offset)
             
-            console.print(f"[blue]发现 {len(requests)} 个合并请求[/blue]")
-            self.logger.info(f"开始处理 {len(requests)} 个合并请求")
+            console.print(f"\n[cyan]{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - 收到Hook信号[/cyan]")
+            console.print(f"[blue]发现 {len(entries)} 个新的合并请求[/blue]")
+            self.logger.info(f"开始处理 {len(entries)} 个合并请求")
             
-            # 处理待处理的请求
-            pending_requests = [req for req in requests if req.get('status') == 'pending']
+            # 已有状态的请求（旧版本在请求文件里直接改写的状态）不再处理
+            handled = {offset for offset, req in entries if req.get('status', 'pending') != 'pending'}
+            self._seen_requests.update(request_key(req) for offset, req in entries if offset in handled)
+            # 同一仓库同一版本只处理第一次出现的请求；请求有了处理结果才计入已处理
+            batch_keys = set()
+            for offset, req in entries:
+                if offset in handled:
+                    continue
+                key = request_key(req)
+                if key in self._seen_requests or key in batch_keys:
+                    # 重复的请求不计入已处理：第一次出现的请求可能还没有处理完
+                    append_status(offset, req, 'duplicate')
+                    handled.add(offset)
+                    self.logger.info(f"版本 {req['revision']} 的合并请求重复，跳过")
+                batch_keys.add(key)
+            pending_requests = [(offset, req) for offset, req in entries if offset not in handled]
             if not pending_requests:
-                console.print("[dim]没有待处理的请求[/dim]")
+                self.logger.debug("没有待处理的请求")
+                self._advance_offset(entries, handled, end_offset)
                 return
             
             console.print(f"[yellow]处理 {len(pending_requests)} 个待处理的请求[/yellow]")
             self.logger.info(f"处理 {len(pending_requests)} 个待处理的请求")
             
-            for i, request in enumerate(pending_requests, 1):
-                console.print(f"\n[cyan]处理请求 {i}/{len(pending_requests)}[/cyan]")
-                console.print(f"[dim]版本: {request['revision']}[/dim]")
-                console.print(f"[dim]作者: {request['author']}[/dim]")
-                console.print(f"[dim]消息: {request['message'][:60]}...[/dim]")
-                
-                self.logger.info(f"处理Hook请求 {i}/{len(pending_requests)}: 版本 {request['revision']}")
-                
-                # 创建提交对象
-                commit = {
-                    'revision': int(request['revision']),
-                    'author': request['author'],
-                    'message': request['message']
-                }
-                
-                # 执行合并
-                if self._should_merge(commit):
-                    console.print(f"[yellow]提交 {commit['revision']} 匹配合并规则，开始自动合并...[/yellow]")
-                    self.logger.info(f"提交 {commit['revision']} 匹配合并规则，开始自动合并")
+            # 每个请求的结果处理完就记录；中途出错时只推进到已连续处理完的位置
+            merge_requests = []
+            try:
+                for i, (offset, request) in enumerate(pending_requests, 1):
+                    console.print(f"\n[cyan]处理请求 {i}/{len(pending_requests)}[/cyan]")
+                    console.print(f"[dim]版本: {request['revision']}[/dim]")
+                    console.print(f"[dim]作者: {request['author']}[/dim]")
+                    console.print(f"[dim]消息: {request['message'][:60]}...[/dim]")
+                    
+                    self.logger.info(f"处理Hook请求 {i}/{len(pending_requests)}: 版本 {request['revision']}")
                     
-                    if self._perform_merge(commit):
-                        request['status'] = 'completed'
+                    # 创建提交对象
+                    commit = {
+                        'revision': int(request['revision']),
+                        # 同一作者连续的多个提交会合并成一个请求
+                        'revisions': [int(rev) for rev in request.get('revisions', [request['revision']])],
+                        'author': request['author'],
+                        'message': request['message'],
+                        'repository': request.get('repository')
+                    }
+                    
+                    # 匹配的提交交给线程池合并
+                    if self._should_merge(commit):
+                        console.print(f"[yellow]提交 {commit['revision']} 匹配合并规则，开始自动合并...[/yellow]")
+                        self.logger.info(f"提交 {commit['revision']} 匹配合并规则，开始自动合并")
+                        merge_requests.append((offset, request, commit))
+                    else:
+                        self._record_status(offset, request, 'skipped', handled)
+                        console.print(f"[dim]提交 {commit['revision']} 不匹配合并规则，跳过[/dim]")
+                        self.logger.info(f"提交 {commit['revision']} 不匹配合并规则，跳过")
+                
+                request_of = {id(commit): (offset, request) for offset, request, commit in merge_requests}
+                for commit, success in self._merge_in_pool([commit for _, _, commit in merge_requests]):
+                    offset, request = request_of[id(commit)]
+                    if success:
+                        self._record_status(offset, request, 'completed', handled)
                         console.print(f"[green]✅ Hook合并成功: 版本 {commit['revision']}[/green]")
                         self.logger.info(f"Hook合并成功: 版本 {commit['revision']}")
                     else:
-                        request['status'] = 'failed'
+                        self._record_status(offset, request, 'failed', handled)
                         console.print(f"[red]❌ Hook合并失败: 版本 {commit['revision']}[/red]")
                         self.logger.error(f"Hook合并失败: 版本 {commit['revision']}")
-                else:
-                    request['status'] = 'skipped'
-                    console.print(f"[dim]提交 {commit['revision']} 不匹配合并规则，跳过[/dim]")
-                    self.logger.info(f"提交 {commit['revision']} 不匹配合并规则，跳过")
-            
-            # 保存更新后的请求
-            with open(request_file, 'w', encoding='utf-8') as f:
-                json.dump(requests, f, indent=2, ensure_ascii=False)
+            finally:
+                self._advance_offset(entries, handled, end_offset)
             
             console.print(f"\n[green]✅ 完成处理 {len(pending_requests)} 个请求[/green]")
             self.logger.info(f"完成处理 {len(pending_requests)} 个请求")
@@ -298,21 +818,51 @@ class SVNAgent:
             console.print(f"[red]处理Hook请求时出错: {e}[/red]")
             self.logger.error(f"处理Hook请求时出错: {e}")
     
+    def _record_status(self, offset: int, request: Dict, status: str, handled: set):
+        """记录请求的处理结果，之后同一仓库同一版本的请求视为重复"""
+        append_status(offset, request, status)
+        handled.add(offset)
+        self._seen_requests.add(request_key(request))
+    
+    def _close_request_file(self):
+        """关闭保持打开的合并请求文件"""
+        if self._mr_fp is not None:
+            self._mr_fp.close()
+            self._mr_fp = None
+    
+    def _advance_offset(self, entries: List[Tuple[int, Dict]], handled: set, end_offset: int):
+        """把处理位置推进到第一个未处理的请求，全部处理完时推进到读取结束的位置"""
+        offset = next((offset for offset, _ in entries if offset not in handled), end_offset)
+        if offset != self._processed_offset:
+            self._processed_offset = offset
+            save_offset(offset)
+        if offset == end_offset and offset >= ROTATE_SIZE:
+            self._rotate_request_file()
+    
+    def _rotate_request_file(self):
+        """请求都已处理完时轮转请求文件，避免文件无限增长"""
+        # Windows上打开着的文件不能改名
+        self._close_request_file()
+        try:
+            rotate_requests(self._processed_offset)
+        except OSError as e:
+            # 如Hook进程正在写入，下次处理完再轮转
+            self.logger.debug(f"轮转合并请求文件失败: {e}")
+            return
+        self._processed_offset = 0
+        save_offset(0)
+        self.logger.info("合并请求文件已轮转")
+    
     def _check_merge_requests(self):
-        """检查合并请求文件"""
+        """检查合并请求文件是否有新追加的请求"""
         try:
-            request_file = Path("merge_requests.json")
-            if not request_file.exists():
+            try:
+                if REQUEST_FILE.stat().st_size == self._processed_offset:
+                    return
+            except FileNotFoundError:
                 return
             
-            with open(request_file, 'r', encoding='utf-8') as f:
-                requests = json.load(f)
-            
-            # 检查是否有新的待处理请求
-            pending_requests = [r for r in requests if r.get('status') == 'pending']
-            if pending_requests:
-                console.print(f"[blue]发现 {len(pending_requests)} 个待处理的合并请求[/blue]")
-                self._process_hook_requests()
+            self._process_hook_requests()
                 
         except Exception as e:
             console.print(f"[red]检查合并请求时出错: {e}[/red]")
@@ -336,11 +886,12 @@ class SVNAgent:
                 console.print("[red]无法获取源分支最新版本[/red]")
                 return
             
-            console.print(f"[blue]源分支最新版本: {latest_revision}[/blue]")
-            console.print(f"[blue]上次检查版本: {self.last_checked_revision}[/blue]")
+            self.logger.debug(f"源分支最新版本: {latest_revision}，上次检查版本: {self.last_checked_revision}")
             
             # 检查是否有新提交
             if latest_revision > self.last_checked_revision:
+                console.print(f"[blue]源分支最新版本: {latest_revision}[/blue]")
+                console.print(f"[blue]上次检查版本: {self.last_checked_revision}[/blue]")
                 console.print(f"[green]发现新提交! 版本 {self.last_checked_revision} -> {latest_revision}[/green]")
                 
                 # 获取新提交的详细信息
@@ -348,15 +899,16 @@ class SVNAgent:
                 console.print(f"[blue]获取到 {len(new_commits)} 个新提交[/blue]")
                 
                 # 检查提交信息是否匹配规则
-                merge_success_count = 0
+                matched_commits = []
                 for commit in new_commits:
                     if self._should_merge(commit):
                         console.print(f"[yellow]提交 {commit['revision']} 匹配合并规则，开始自动合并...[/yellow]")
-                        if self._perform_merge(commit):
-                            merge_success_count += 1
+                        matched_commits.append(commit)
                     else:
                         console.print(f"[dim]提交 {commit['revision']} 不匹配合并规则，跳过[/dim]")
                 
+                merge_success_count = sum(1 for _, success in self._merge_in_pool(matched_commits) if success)
+                
                 # 只有在有成功合并时才更新最后检查的版本号
                 if merge_success_count > 0:
                     self._save_last_revision(latest_revision)
@@ -364,7 +916,8 @@ class SVNAgent:
                 else:
                     console.print(f"[yellow]没有成功合并的提交，保持检查版本: {self.last_checked_revision}[/yellow]")
             else:
-                console.print("[dim]没有发现新提交[/dim]")
+                self.logger.debug("没有发现新提交")
+                self._flush_last_revision()
                 
         except Exception as e:
             console.print(f"[red]检查新提交时出错: {e}[/red]")
@@ -375,6 +928,7 @@ class SVNAgent:
     
     def show_config(self):
         """显示当前配置"""
+        from rich.table import Table
         table = Table(title="当前配置")
         table.add_column("配置项", style="cyan")
         table.add_column("值", style="magenta")
@@ -388,81 +942,190 @@ class SVNAgent:
     
     def _get_latest_revision(self, branch_path: str) -> Optional[int]:
         """获取分支的最新版本号"""
+        if self._svn_client is not None:
+            try:
+                return self._svn_client.info2(branch_path, recurse=False)[0][1]['rev'].number
+            except pysvn.ClientError as e:
+                self.logger.error(f"获取最新版本号失败: {e}")
+                return None
+        
         try:
             cmd = ['svn', 'info', branch_path, '--show-item', 'revision']
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            return int(result.stdout.strip())
+            result = subprocess.run(cmd, capture_output=True, check=True)
+            return int(result.stdout)
         except (subprocess.CalledProcessError, ValueError) as e:
             self.logger.error(f"获取最新版本号失败: {e}")
             return None
     
     def _get_commits_info(self, branch_path: str, from_revision: int, to_revision: int) -> List[Dict]:
-        """获取指定版本范围内的提交信息"""
-        commits = []
+        """获取指定版本范围内的提交信息，出错时返回空列表"""
         try:
-            cmd = ['svn', 'log', branch_path, '-r', f'{from_revision+1}:{to_revision}', '--xml']
-            console.print(f"[dim]执行命令: {' '.join(cmd)}[/dim]")
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            console.print(f"[dim]SVN log输出: {result.stdout[:200]}...[/dim]")
-            
-            # 简单的XML解析（实际项目中建议使用xml.etree.ElementTree）
-            import re
-            revision_pattern = r'<logentry\s+revision="(\d+)"'
-            author_pattern = r'<author>(.*?)</author>'
-            msg_pattern = r'<msg>(.*?)</msg>'
-            
-            revisions = re.findall(revision_pattern, result.stdout)
-            authors = re.findall(author_pattern, result.stdout)
-            messages = re.findall(msg_pattern, result.stdout, re.DOTALL)
-            
-            console.print(f"[dim]解析结果: {len(revisions)} 个版本, {len(authors)} 个作者, {len(messages)} 个消息[/dim]")
-            
-            for i, revision in enumerate(revisions):
-                commits.append({
-                    'revision': int(revision),
-                    'author': authors[i] if i < len(authors) else 'unknown',
-                    'message': messages[i] if i < len(messages) else ''
-                })
-                
+            return self._fetch_commits_info(branch_path, from_revision, to_revision)
         except subprocess.CalledProcessError as e:
             console.print(f"[red]获取提交信息失败: {e}[/red]")
             console.print(f"[red]错误输出: {e.stderr if hasattr(e, 'stderr') else 'N/A'}[/red]")
             self.logger.error(f"获取提交信息失败: {e}")
         except Exception as e:
-            console.print(f"[red]解析提交信息时出错: {e}[/red]")
-            self.logger.error(f"解析提交信息时出错: {e}")
-            
+            console.print(f"[red]获取提交信息时出错: {e}[/red]")
+            self.logger.error(f"获取提交信息时出错: {e}")
+        return []
+    
+    def _fetch_commits_info(self, branch_path: str, from_revision: int, to_revision: int) -> List[Dict]:
+        """获取指定版本范围内的提交信息，svn出错时抛出异常"""
+        if self._svn_client is not None:
+            return self._get_commits_info_pysvn(branch_path, from_revision, to_revision)
+        
+        commits = []
+        cmd = ['svn', 'log', branch_path, '-r', f'{from_revision+1}:{to_revision}', '--xml']
+        # 只取回可能匹配规则的提交，最终是否合并仍由 _should_merge 判断
+        cmd += self._search_args
+        console.print(f"[dim]执行命令: {' '.join(cmd)}[/dim]")
+        
+        # 边读取svn输出边解析，每个logentry处理完立即释放；
+        # stderr写到临时文件，避免读stdout时stderr管道写满造成死锁
+        with tempfile.TemporaryFile() as stderr_file:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+            try:
+                for _, elem in ET.iterparse(proc.stdout, events=('end',)):
+                    if elem.tag == 'logentry':
+                        commits.append({
+                            'revision': int(elem.get('revision')),
+                            'author': elem.findtext('author', 'unknown'),
+                            'message': elem.findtext('msg', '')
+                        })
+                        elem.clear()
+            except ET.ParseError:
+                # svn出错时输出不完整，错误信息在下面从stderr读取
+                pass
+            finally:
+                proc.stdout.close()
+                proc.wait()
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode('utf-8', errors='replace')
+        
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+        
+        console.print(f"[dim]解析结果: {len(commits)} 个提交[/dim]")
+        
         return commits
     
+    def _get_commits_info_pysvn(self, branch_path: str, from_revision: int, to_revision: int) -> List[Dict]:
+        """通过pysvn获取指定版本范围内的提交信息，不需要启动svn进程和解析XML
+        
+        出错时抛出 pysvn.ClientError
+        """
+        entries = self._svn_client.log(
+            branch_path,
+            revision_start=pysvn.Revision(pysvn.opt_revision_kind.number, from_revision + 1),
+            revision_end=pysvn.Revision(pysvn.opt_revision_kind.number, to_revision)
+        )
+        
+        return [
+            {
+                'revision': entry.revision.number,
+                'author': entry.get('author', 'unknown'),
+                'message': entry.get('message', '')
+            }
+            for entry in entries
+        ]
+    
     def _should_merge(self, commit: Dict) -> bool:
-        """检查提交是否应该被合并"""
+        """检查提交是否应该被合并，结果按版本缓存"""
+        # 同一作者连续的多个提交合并成的请求用全部版本号作为键；不同仓库的同一版本号是不同的提交
+        revisions = ','.join(str(rev) for rev in commit.get('revisions', [commit['revision']]))
+        key = f"{revisions}|{commit.get('repository') or ''}"
+        cached = self._match_cache.get(key)
+        if cached is not None:
+            if cached:
+                console.print(f"[green]✅ 提交 {commit['revision']} 匹配所有规则，将进行合并[/green]")
+            return cached
+        
+        should_merge = self._match_commit(commit)
+        self._match_cache[key] = should_merge
+        self._match_cache_unsaved += 1
+        if self._match_cache_unsaved >= MATCH_CACHE_FLUSH_EVERY:
+            self._flush_match_cache()
+        return should_merge
+    
+    def _match_commit(self, commit: Dict) -> bool:
+        """用匹配规则检查提交信息"""
         message = commit.get('message', '')
         author = commit.get('author', '')
         
         # 检查匹配规则
-        match_patterns = self.config.get('match_patterns', {})
+        if not self._compiled_patterns:
+            return False
         
-        if not match_patterns:
+        # 所有规则都必须匹配，缺少任何一条规则的字面量时不需要进入正则引擎
+        folded = message.casefold()
+        if not all(literal in folded for literal in self._prefilter_literals):
             return False
         
+        # 先用合并后的正则扫描一遍，一条规则都没有命中时直接返回
+        found_groups = set()
+        if self._union_pattern is not None:
+            found_groups = {m.lastgroup for m in self._union_pattern.finditer(message)}
+            if not found_groups:
+                return False
+        
         # 必须匹配所有规则才能合并 (AND逻辑)
-        matched_patterns = []
-        for pattern_name, pattern in match_patterns.items():
-            if re.search(pattern, message, re.IGNORECASE):
-                matched_patterns.append(pattern_name)
+        # 匹配位置重叠的规则可能在一次扫描中被遮住，只对这些规则单独再检查
+        matched_patterns = [
+            pattern_name
+            for i, (pattern_name, pattern) in enumerate(self._compiled_patterns)
+            if f"rule{i}" in found_groups or pattern.search(message)
+        ]
         
         # 只有当所有规则都匹配时才合并
-        should_merge = len(matched_patterns) == len(match_patterns)
+        should_merge = len(matched_patterns) == len(self._compiled_patterns)
         
         # 只有符合规则的提交才输出详细日志
         if should_merge:
             console.print(f"[green]✅ 提交 {commit['revision']} 匹配所有规则，将进行合并[/green]")
-            for pattern_name, pattern in match_patterns.items():
-                console.print(f"[green]  匹配规则 '{pattern_name}': {pattern}[/green]")
+            for pattern_name, pattern in self._compiled_patterns:
+                console.print(f"[green]  匹配规则 '{pattern_name}': {pattern.pattern}[/green]")
         
         return should_merge
     
+    def _merge_in_pool(self, commits: List[Dict]):
+        """在线程池中合并提交，每完成一个目标分支的任务就按原顺序产出 (提交, 是否成功)
+        
+        同一工作副本的提交必须按版本顺序逐个合并，所以按目标分支分组，每组作为一个任务顺序执行；
+        不同目标分支的任务可以并行。
+        非Hook模式下合并时要在终端确认（Hook模式不询问），直接在当前线程依次合并：工作线程阻塞在输入上时
+        Ctrl+C无法让进程退出
+        """
+        groups: Dict[str, List[Dict]] = {}
+        for commit in commits:
+            target_branch = commit.get('target_branch') or self.config.get('target_branch', '')
+            groups.setdefault(target_branch, []).append(commit)
+        
+        if not self._is_hook_mode():
+            for target_branch, group in groups.items():
+                yield from zip(group, self._perform_merges_locked(target_branch, group))
+            return
+        
+        futures = {
+            self._pool.submit(self._perform_merges_locked, target_branch, group): group
+            for target_branch, group in groups.items()
+        }
+        for future in as_completed(futures):
+            yield from zip(futures[future], future.result())
+    
+    def _perform_merges_locked(self, target_branch: str, commits: List[Dict]) -> List[bool]:
+        """持有目标分支的锁，依次合并提交，返回已合并的提交的结果（停止时可能少于commits）"""
+        with self._branch_locks_guard:
+            lock = self._branch_locks.setdefault(target_branch, threading.Lock())
+        results = []
+        with lock:
+            for commit in commits:
+                # 停止后不再开始新的合并，未合并的请求保持待处理，下次启动时继续
+                if self._stop_merges.is_set():
+                    break
+                results.append(self._perform_merge(commit))
+        return results
+    
     def _perform_merge(self, commit: Dict) -> bool:
         """执行自动合并，返回是否成功"""
         try:
@@ -566,43 +1229,48 @@ class SVNAgent:
         """清理并更新目标分支"""
         try:
             # 检查是否跳过清理步骤
-            skip_cleanup_file = Path("skip_cleanup.json")
             skip_cleanup = False
-            if skip_cleanup_file.exists():
-                try:
-                    with open(skip_cleanup_file, 'r', encoding='utf-8') as f:
-                        skip_config = json.load(f)
-                        skip_cleanup = skip_config.get('skip_cleanup', False)
-                        if skip_cleanup:
-                            console.print("[yellow]检测到跳过清理配置，将跳过清理步骤[/yellow]")
-                except:
-                    pass
-            
-            # 切换到目标分支目录
-            original_dir = os.getcwd()
-            os.chdir(target_branch)
+            try:
+                skip_config = load_json("skip_cleanup.json")
+                skip_cleanup = skip_config.get('skip_cleanup', False)
+                if skip_cleanup:
+                    console.print("[yellow]检测到跳过清理配置，将跳过清理步骤[/yellow]")
+            except:
+                # 没有配置文件（FileNotFoundError）或配置无效时不跳过清理
+                pass
             
-            console.print(f"[dim]切换到目标分支目录: {target_branch}[/dim]")
+            # svn命令都在目标分支目录下执行，不切换进程的当前目录
+            console.print(f"[dim]目标分支目录: {target_branch}[/dim]")
             
             if not skip_cleanup:
+                # 先在一个shell里依次执行清理、还原和更新，只启动一次进程；
+                # 失败时（如工作副本被锁定）再逐步执行，以便处理锁定问题
+                console.print("[dim]清理工作副本、还原本地修改并更新到最新版本...[/dim]")
+                result = subprocess.run('svn cleanup && svn revert -R . && svn update',
+                                        shell=True, cwd=target_branch, capture_output=True)
+                if result.returncode == 0:
+                    self._report_update(result)
+                    return True
+                console.print(f"[yellow]清理更新失败，逐步执行: {_decode_output(result.stderr)}[/yellow]")
+                
                 # 1. 清理工作副本（移除未版本控制的文件）
                 console.print("[dim]清理工作副本...[/dim]")
                 cleanup_cmd = ['svn', 'cleanup']
-                result = subprocess.run(cleanup_cmd, capture_output=True, text=True)
+                result = subprocess.run(cleanup_cmd, cwd=target_branch, capture_output=True)
                 if result.returncode != 0:
-                    console.print(f"[yellow]清理警告: {result.stderr}[/yellow]")
+                    console.print(f"[yellow]清理警告: {_decode_output(result.stderr)}[/yellow]")
                     
                     # 检查是否是锁定问题
-                    if "E155004" in result.stderr and "locked" in result.stderr:
+                    if b"E155004" in result.stderr and b"locked" in result.stderr:
                         console.print("[yellow]检测到SVN锁定问题，尝试自动修复...[/yellow]")
                         if self._fix_svn_locks(target_branch):
                             console.print("[green]SVN锁定问题已自动修复[/green]")
                             # 重新尝试清理
-                            result = subprocess.run(cleanup_cmd, capture_output=True, text=True)
+                            result = subprocess.run(cleanup_cmd, cwd=target_branch, capture_output=True)
                             if result.returncode == 0:
                                 console.print("[green]清理成功[/green]")
                             else:
-                                console.print(f"[yellow]清理仍然失败: {result.stderr}[/yellow]")
+                                console.print(f"[yellow]清理仍然失败: {_decode_output(result.stderr)}[/yellow]")
                                 skip_cleanup = True
                         else:
                             console.print("[red]自动修复SVN锁定失败[/red]")
@@ -616,69 +1284,59 @@ class SVNAgent:
                     # 2. 还原所有本地修改
                     console.print("[dim]还原本地修改...[/dim]")
                     revert_cmd = ['svn', 'revert', '-R', '.']
-                    result = subprocess.run(revert_cmd, capture_output=True, text=True)
+                    result = subprocess.run(revert_cmd, cwd=target_branch, capture_output=True)
                     if result.returncode != 0:
-                        console.print(f"[yellow]还原警告: {result.stderr}[/yellow]")
+                        console.print(f"[yellow]还原警告: {_decode_output(result.stderr)}[/yellow]")
             
             # 3. 更新到最新版本
             console.print("[dim]更新到最新版本...[/dim]")
             update_cmd = ['svn', 'update']
-            result = subprocess.run(update_cmd, capture_output=True, text=True)
+            result = subprocess.run(update_cmd, cwd=target_branch, capture_output=True)
             
             if result.returncode == 0:
-                console.print("[green]目标分支更新成功[/green]")
-                # 显示更新信息
-                if "Updated to revision" in result.stdout:
-                    revision_line = [line for line in result.stdout.split('\n') if 'Updated to revision' in line]
-                    if revision_line:
-                        console.print(f"[blue]{revision_line[0]}[/blue]")
+                self._report_update(result)
                 return True
             else:
-                console.print(f"[red]更新失败: {result.stderr}[/red]")
+                console.print(f"[red]更新失败: {_decode_output(result.stderr)}[/red]")
                 return False
                 
         except Exception as e:
             console.print(f"[red]清理更新目标分支时出错: {e}[/red]")
             return False
-        finally:
-            # 恢复原始目录
-            os.chdir(original_dir)
+    
+    def _report_update(self, result: subprocess.CompletedProcess):
+        """显示目标分支更新成功的信息"""
+        console.print("[green]目标分支更新成功[/green]")
+        # 显示更新信息（更新输出可能列出大量文件，只解码需要的这一行）
+        revision_line = _find_output_line(result.stdout, b'Updated to revision')
+        if revision_line:
+            console.print(f"[blue]{revision_line}[/blue]")
     
     def _fix_svn_locks(self, target_branch: str) -> bool:
         """自动修复SVN锁定问题"""
         try:
             console.print("[blue]开始自动修复SVN锁定问题...[/blue]")
             
-            # 1. 终止SVN进程
-            try:
-                result = subprocess.run(['tasklist', '/FI', 'IMAGENAME eq svn.exe'], 
-                                      capture_output=True, text=True)
-                if 'svn.exe' in result.stdout:
-                    console.print("[dim]终止SVN进程...[/dim]")
-                    subprocess.run(['taskkill', '/IM', 'svn.exe', '/F'], 
-                                  capture_output=True, text=True)
-                    time.sleep(1)
-            except:
-                pass
+            # 1. 终止在目标分支下运行的SVN进程，不影响其他工作副本
+            self._terminate_svn_processes(target_branch)
             
             # 2. 删除锁定文件
             lock_files = ['.svn/wc.db-journal', '.svn/lock', '.svn/entries.lock']
             deleted_count = 0
             
             for lock_file in lock_files:
-                if os.path.exists(lock_file):
-                    try:
-                        os.remove(lock_file)
-                        deleted_count += 1
-                    except:
-                        pass
+                try:
+                    Path(target_branch, lock_file).unlink()
+                    deleted_count += 1
+                except OSError:
+                    pass
             
             if deleted_count > 0:
                 console.print(f"[dim]删除了 {deleted_count} 个锁定文件[/dim]")
             
             # 3. 重新尝试清理
             cleanup_cmd = ['svn', 'cleanup']
-            result = subprocess.run(cleanup_cmd, capture_output=True, text=True, timeout=30)
+            result = subprocess.run(cleanup_cmd, cwd=target_branch, capture_output=True, timeout=30)
             
             return result.returncode == 0
             
@@ -686,6 +1344,42 @@ class SVNAgent:
             console.print(f"[red]修复SVN锁定时出错: {e}[/red]")
             return False
     
+    def _terminate_svn_processes(self, target_branch: str):
+        """终止工作目录在目标分支下的svn进程"""
+        # 可选：安装了psutil时修复锁定只终止目标分支下的svn进程；只在修复锁定时才导入
+        try:
+            import psutil
+        except ImportError:
+            console.print("[dim]未安装psutil，跳过终止SVN进程[/dim]")
+            return
+        
+        root = os.path.normcase(os.path.abspath(target_branch))
+        procs = []
+        for proc in psutil.process_iter(['name', 'cwd']):
+            name = (proc.info['name'] or '').lower()
+            cwd = proc.info['cwd']
+            if name not in ('svn', 'svn.exe') or not cwd:
+                continue
+            cwd = os.path.normcase(os.path.abspath(cwd))
+            if cwd == root or cwd.startswith(root.rstrip(os.sep) + os.sep):
+                procs.append(proc)
+        
+        if not procs:
+            return
+        
+        console.print(f"[dim]终止 {len(procs)} 个SVN进程...[/dim]")
+        for proc in procs:
+            try:
+                proc.terminate()
+            except psutil.NoSuchProcess:
+                pass
+        _, alive = psutil.wait_procs(procs, timeout=2)
+        for proc in alive:
+            try:
+                proc.kill()
+            except psutil.NoSuchProcess:
+                pass
+    
     def _confirm_target_branch_cleanup(self, target_branch: str) -> bool:
         """确认清理目标分支"""
         try:
@@ -763,16 +1457,19 @@ class SVNAgent:
             return False
     
     def _is_hook_mode(self) -> bool:
-        """检查是否在Hook模式下运行"""
+        """检查是否在Hook模式下运行
+        
+        运行模式已由入口方法确定时直接返回；否则检查一次文件和命令行参数并缓存结果
+        """
+        if self._hook_mode is None:
+            self._hook_mode = self._detect_hook_mode()
+        return self._hook_mode
+    
+    def _detect_hook_mode(self) -> bool:
+        """根据合并请求文件和命令行参数判断是否是Hook模式"""
         try:
-            # 检查是否有Hook信号文件存在
-            signal_file = Path("hook_signal.txt")
-            if signal_file.exists():
-                return True
-            
             # 检查是否有合并请求文件存在
-            request_file = Path("merge_requests.json")
-            if request_file.exists():
+            if REQUEST_FILE.exists():
                 return True
             
             # 检查命令行参数
@@ -787,28 +1484,34 @@ class SVNAgent:
     def _execute_svn_merge(self, source_branch: str, target_branch: str, commit: Dict) -> Dict:
         """执行SVN合并操作"""
         try:
-            # 切换到目标分支目录
-            original_dir = os.getcwd()
-            os.chdir(target_branch)
-            
-            # 执行SVN合并
-            merge_cmd = ['svn', 'merge', source_branch, '-r', f'{commit["revision"]-1}:{commit["revision"]}']
+            # 执行SVN合并（在目标分支目录下执行，不切换进程的当前目录）
+            # 连续的多个版本用一次范围合并完成
+            revisions = commit.get('revisions') or [commit['revision']]
+            merge_cmd = ['svn', 'merge', source_branch, '-r', f'{revisions[0]-1}:{revisions[-1]}']
             console.print(f"[dim]执行合并命令: {' '.join(merge_cmd)}[/dim]")
             
-            result = subprocess.run(merge_cmd, capture_output=True, text=True)
+            # 大的合并会输出很多行，边读边提取文件列表，不把全部输出留在内存里；
+            # stderr写到临时文件，避免读stdout时stderr管道写满造成死锁
+            with tempfile.TemporaryFile() as stderr_file:
+                with subprocess.Popen(merge_cmd, cwd=target_branch,
+                                      stdout=subprocess.PIPE, stderr=stderr_file) as proc:
+                    merged_files = self._extract_merged_files(proc.stdout)
+                    returncode = proc.wait()
+                stderr_file.seek(0)
+                stderr = stderr_file.read()
             
-            if result.returncode == 0:
+            if returncode == 0:
                 console.print("[green]SVN合并操作成功[/green]")
                 return {
                     'success': True,
-                    'output': result.stdout,
-                    'merged_files': self._extract_merged_files(result.stdout)
+                    'merged_files': merged_files
                 }
             else:
-                console.print(f"[red]SVN合并操作失败: {result.stderr}[/red]")
+                error = _decode_output(stderr)
+                console.print(f"[red]SVN合并操作失败: {error}[/red]")
                 return {
                     'success': False,
-                    'error': result.stderr
+                    'error': error
                 }
                 
         except Exception as e:
@@ -817,28 +1520,22 @@ class SVNAgent:
                 'success': False,
                 'error': str(e)
             }
-        finally:
-            # 恢复原始目录
-            os.chdir(original_dir)
     
-    def _extract_merged_files(self, merge_output: str) -> List[str]:
-        """从合并输出中提取合并的文件列表"""
+    def _extract_merged_files(self, merge_output: Iterable[bytes]) -> List[str]:
+        """从合并输出中提取合并的文件列表
+        
+        merge_output: svn输出的原始bytes行，可以直接传入进程的stdout边读边处理
+        """
         merged_files = []
-        for line in merge_output.split('\n'):
-            if line.strip().startswith(('A ', 'M ', 'D ', 'C ', 'G ')):
-                # SVN状态码: A=添加, M=修改, D=删除, C=冲突, G=合并
-                file_path = line.strip()[2:].strip()
-                if file_path:
-                    merged_files.append(file_path)
+        for line in merge_output:
+            match = _MERGE_LINE_RE.match(line)
+            if match:
+                merged_files.append(_decode_output(match.group(1)))
         return merged_files
     
     def _commit_merge_with_message(self, source_branch: str, target_branch: str, commit: Dict, merge_result: Dict):
         """使用标准SVN合并信息格式提交合并"""
         try:
-            # 切换到目标分支目录
-            original_dir = os.getcwd()
-            os.chdir(target_branch)
-            
             # 生成标准SVN合并信息
             merge_message = self._generate_merge_message(source_branch, commit, merge_result)
             
@@ -847,43 +1544,41 @@ class SVNAgent:
             
             # 执行提交
             commit_cmd = ['svn', 'commit', '-m', merge_message]
-            result = subprocess.run(commit_cmd, capture_output=True, text=True)
+            result = subprocess.run(commit_cmd, cwd=target_branch, capture_output=True)
             
             if result.returncode == 0:
                 console.print("[green]合并提交成功[/green]")
                 # 显示提交结果
-                if "Committed revision" in result.stdout:
-                    revision_line = [line for line in result.stdout.split('\n') if 'Committed revision' in line]
-                    if revision_line:
-                        console.print(f"[blue]{revision_line[0]}[/blue]")
+                revision_line = _find_output_line(result.stdout, b'Committed revision')
+                if revision_line:
+                    console.print(f"[blue]{revision_line}[/blue]")
             else:
-                console.print(f"[red]合并提交失败: {result.stderr}[/red]")
+                console.print(f"[red]合并提交失败: {_decode_output(result.stderr)}[/red]")
                 
         except Exception as e:
             console.print(f"[red]提交合并时出错: {e}[/red]")
-        finally:
-            # 恢复原始目录
-            os.chdir(original_dir)
     
     def _generate_merge_message(self, source_branch: str, commit: Dict, merge_result: Dict) -> str:
         """生成标准SVN合并信息格式"""
         # 提取源分支名称（从完整路径中）
         branch_name = source_branch.split('\\')[-1] if '\\' in source_branch else source_branch.split('/')[-1]
         
-        # 生成合并信息
-        merge_message = f"Merged revision(s) {commit['revision']} from branches/{branch_name}:\n"
-        merge_message += f"{commit['message']}\n"
+        # 生成合并信息，各行收集到列表中最后一次拼接
+        revisions = commit.get('revisions') or [commit['revision']]
+        lines = [
+            f"Merged revision(s) {', '.join(map(str, revisions))} from branches/{branch_name}:",
+            commit['message'],
+        ]
         
         # 添加合并的文件信息
         merged_files = merge_result.get('merged_files', [])
         if merged_files:
-            merge_message += "\n合并的文件:\n"
-            for file_path in merged_files[:10]:  # 最多显示10个文件
-                merge_message += f"  {file_path}\n"
+            lines.append("\n合并的文件:")
+            lines.extend(f"  {file_path}" for file_path in merged_files[:10])  # 最多显示10个文件
             if len(merged_files) > 10:
-                merge_message += f"  ... 还有 {len(merged_files) - 10} 个文件\n"
+                lines.append(f"  ... 还有 {len(merged_files) - 10} 个文件")
         
-        return merge_message.strip()
+        return '\n'.join(lines).strip()
     
     def _analyze_conflicts(self, commit: Dict):
         """使用AI分析冲突（如果启用）"""
@@ -896,6 +1591,7 @@ class SVNAgent:
     
     def _show_manual_resolve_prompt(self, commit: Dict, error_message: str):
         """显示手动解决冲突的提示"""
+        from rich.panel import Panel
         console.print("\n" + "="*80)
         console.print(Panel(
             f"[bold red]⚠️  自动合并失败 - 检测到冲突[/bold red]\n\n"
@@ -923,6 +1619,10 @@ class SVNAgent:
         # 记录到日志
         self.logger.error(f"合并冲突需要手动解决: 提交 {commit['revision']} - {error_message}")
         
+        # Hook模式在线程池中合并，没有终端可以回答，直接继续处理其他提交
+        if self._is_hook_mode():
+            return True
+        
         # 询问用户是否继续
         try:
             from rich.prompt import Confirm
@@ -937,6 +1637,7 @@ class SVNAgent:
     
     def _show_merge_failure_prompt(self, commit: Dict, error_message: str):
         """显示合并失败的提示"""
+        from rich.panel import Panel
         console.print("\n" + "="*80)
         console.print(Panel(
             f"[bold red]❌ 自动合并失败[/bold red]\n\n"
@@ -968,6 +1669,10 @@ class SVNAgent:
         # 记录到日志
         self.logger.error(f"合并失败: 提交 {commit['revision']} - {error_message}")
         
+        # Hook模式在线程池中合并，没有终端可以回答，直接继续处理其他提交
+        if self._is_hook_mode():
+            return True
+        
         # 询问用户是否继续
         try:
             from rich.prompt import Confirm
@@ -993,15 +1698,17 @@ class SVNAgent:
             if current_revision:
                 # 如果last_revision.txt不存在，则创建并设置为当前版本
                 revision_file = Path("logs/last_revision.txt")
-                if not revision_file.exists():
+                try:
+                    # 如果文件已存在，读取现有版本
+                    with open(revision_file, 'rb') as f:
+                        existing_revision = int(f.read())
+                except FileNotFoundError:
                     revision_file.parent.mkdir(exist_ok=True)
                     revision_file.write_text(str(current_revision), encoding='utf-8')
                     self.last_checked_revision = current_revision
                     console.print(f"[green]已记录启动版本: {current_revision}[/green]")
                     console.print(f"[dim]将只检查版本 {current_revision} 之后的新提交[/dim]")
                 else:
-                    # 如果文件已存在，读取现有版本
-                    existing_revision = int(revision_file.read_text(encoding='utf-8').strip())
                     self.last_checked_revision = existing_revision
                     console.print(f"[blue]使用已存在的检查版本: {existing_revision}[/blue]")
                     console.print(f"[dim]将检查版本 {existing_revision} 之后的新提交[/dim]")
@@ -1013,12 +1720,19 @@ class SVNAgent:
             self.logger.error(f"记录启动版本时出错: {e}")
     
     def _save_last_revision(self, revision: int):
-        """保存最后检查的版本号"""
+        """更新最后检查的版本号，文件在空闲或退出时由 _flush_last_revision 写入"""
+        self.last_checked_revision = revision
+        self._pending_revision = revision
+    
+    def _flush_last_revision(self):
+        """把还没写入的检查版本号原子地写入文件"""
+        if self._pending_revision is None:
+            return
         try:
             revision_file = Path("logs/last_revision.txt")
             revision_file.parent.mkdir(exist_ok=True)
-            revision_file.write_text(str(revision), encoding='utf-8')
-            self.last_checked_revision = revision
+            atomic_write(revision_file, str(self._pending_revision).encode('ascii'))
+            self._pending_revision = None
         except Exception as e:
             self.logger.error(f"保存版本号失败: {e}")
 
@@ -1030,11 +1744,17 @@ def main():
     parser.add_argument('--config', default='config.json', help='配置文件路径')
     parser.add_argument('--auto-start', action='store_true', help='自动启动检查并进入轮询模式')
     parser.add_argument('--hook', action='store_true', help='Hook模式，监听SVN hook信号')
+    parser.add_argument('--verbose', action='store_true', help='输出调试日志')
     
     args = parser.parse_args()
     
+    # 被终止时正常退出，让atexit写入还在内存中的检查版本号和匹配缓存
+    for sig_name in ('SIGTERM', 'SIGBREAK'):
+        if hasattr(signal, sig_name):
+            signal.signal(getattr(signal, sig_name), lambda signum, frame: sys.exit(0))
+    
     # 创建智能体实例
-    agent = SVNAgent(args.config)
+    agent = SVNAgent(args.config, verbose=args.verbose)
     
     if args.hook:
         agent.hook_mode()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SVN命令结果缓存 - 指定了具体版本号的svn命令（如 svn log -r 123 --xml）输出不会变化，
+按仓库UUID缓存到shelve，再次查询同一版本时不需要访问SVN服务器
+"""
+
+import re
+import shelve
+import subprocess
+from pathlib import Path
+
+try:
+    CACHE_DIR = Path.home() / '.svn_auto_merge_cache'
+except RuntimeError:  # Hook环境中可能没有HOME等变量
+    CACHE_DIR = Path('.svn_auto_merge_cache')
+# 路径 -> 仓库UUID 的缓存
+UUID_CACHE = CACHE_DIR / 'uuids'
+
+_PINNED_REVISION_RE = re.compile(r'\d+(:\d+)?')
+
+def _is_revision_pinned(cmd):
+    """命令是否只涉及具体的版本号（HEAD、BASE、日期等都会变化，不能缓存）"""
+    for option, value in zip(cmd, cmd[1:]):
+        if option == '-r':
+            return _PINNED_REVISION_RE.fullmatch(value) is not None
+    return False
+
+def _run(cmd):
+    return subprocess.run(cmd, capture_output=True)
+
+def repos_uuid(repos_path):
+    """返回路径所在仓库的UUID，获取失败时返回None"""
+    key = str(repos_path)
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        with shelve.open(str(UUID_CACHE)) as db:
+            uuid = db.get(key)
+            if uuid is None:
+                result = _run(['svn', 'info', '--show-item', 'repos-uuid', key])
+                if result.returncode != 0:
+                    return None
+                uuid = db[key] = result.stdout.decode('ascii').strip()
+            return uuid
+    except Exception:
+        # 缓存不可用（如被其他Hook进程占用）时不影响正常流程
+        return None
+
+def cached_run(cmd, repos_path):
+    """执行svn命令，固定版本号的命令成功时缓存输出
+    
+    repos_path 为命令查询的仓库路径，用于确定缓存所属的仓库。
+    返回 subprocess.CompletedProcess，stdout/stderr 为bytes
+    """
+    if not _is_revision_pinned(cmd):
+        return _run(cmd)
+    
+    uuid = repos_uuid(repos_path)
+    if uuid is None:
+        return _run(cmd)
+    
+    key = '\0'.join(cmd)
+    result = None
+    try:
+        with shelve.open(str(CACHE_DIR / uuid)) as db:
+            stdout = db.get(key)
+            if stdout is not None:
+                return subprocess.CompletedProcess(cmd, 0, stdout, b'')
+            result = _run(cmd)
+            if result.returncode == 0:
+                db[key] = result.stdout
+    except Exception:
+        pass
+    return result if result is not None else _run(cmd)
@@ -6,10 +6,13 @@ SVN Hook脚本 - 检测新提交并触发自动合并
 
 import os
 import sys
-import json
-import subprocess
+import io
+import re
 import time
-from pathlib import Path
+import xml.etree.ElementTree as ET
+
+from merge_queue import append_request, load_json, send_hook_event
+from svn_cache import cached_run
 
 def main():
     """SVN Hook主函数"""
@@ -30,116 +33,126 @@ def main():
         print("Not portrait branch, skipping...")
         sys.exit(0)
     
+    # 智能体在运行时只通知版本号，由智能体查询提交信息和检查规则，Hook尽快返回
+    if send_hook_event(repository_path, revision):
+        print("Hook event sent to agent")
+        sys.exit(0)
+    
     # 读取配置文件
-    config_file = Path("config.json")
-    if not config_file.exists():
+    # 直接打开，不存在时捕获异常，Hook每次提交都会执行，省去一次stat
+    try:
+        config = load_json("config.json")
+    except FileNotFoundError:
         print("Config file not found")
         sys.exit(1)
-    
-    try:
-        with open(config_file, 'r', encoding='utf-8') as f:
-            config = json.load(f)
     except Exception as e:
         print(f"Failed to read config: {e}")
         sys.exit(1)
     
-    # 检查匹配规则
+    # 检查匹配规则，读取配置后只编译一次
     match_patterns = config.get('match_patterns', {})
     if not match_patterns:
         print("No match patterns configured")
         sys.exit(0)
+    try:
+        find_rule = compile_rules(match_patterns)
+    except re.error as e:
+        print(f"Invalid match pattern: {e}")
+        sys.exit(1)
     
     # 获取提交信息
     try:
+        # 同一版本的日志不会变化，重复触发时直接使用缓存
         cmd = ['svn', 'log', repository_path, '-r', revision, '--xml']
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = cached_run(cmd, repository_path)
         
         if result.returncode != 0:
-            print(f"Failed to get commit info: {result.stderr}")
+            print(f"Failed to get commit info: {result.stderr.decode('utf-8', 'replace')}")
             sys.exit(1)
         
         # 解析提交信息
-        import re
-        msg_pattern = r'<msg>(.*?)</msg>'
-        author_pattern = r'<author>(.*?)</author>'
-        
-        messages = re.findall(msg_pattern, result.stdout, re.DOTALL)
-        authors = re.findall(author_pattern, result.stdout)
-        
-        if not messages or not authors:
+        entry = next(iter_log_entries(result.stdout), None)
+        if entry is None or entry[1] is None:
             print("Failed to parse commit info")
             sys.exit(1)
         
-        commit_message = messages[0].strip()
-        author = authors[0]
+        _, author, commit_message = entry
+        commit_message = commit_message.strip()
         
         print(f"Commit {revision}: {author} - {commit_message[:50]}...")
         
         # 检查匹配规则
-        should_merge = False
-        for pattern_name, pattern in match_patterns.items():
-            if re.search(pattern, commit_message, re.IGNORECASE):
-                print(f"Matched rule: {pattern_name}")
-                should_merge = True
-                break
-        
-        if not should_merge:
+        rule_name = find_rule(commit_message)
+        if rule_name is None:
             print("Commit does not match merge rules, skipping...")
             sys.exit(0)
+        print(f"Matched rule: {rule_name}")
         
         # 触发自动合并
         print("Triggering auto merge...")
-        trigger_auto_merge(config, revision, author, commit_message)
+        trigger_auto_merge(config, repository_path, revision, author, commit_message)
         
     except Exception as e:
         print(f"Error in hook: {e}")
         sys.exit(1)
 
-def trigger_auto_merge(config, revision, author, commit_message):
+# 按编号引用分组的写法（\1、(?(1)...)）：规则合并后分组重新编号，引用会指向别的分组
+_NUMBERED_GROUP_REF_RE = re.compile(r'\\[1-9]|\(\?\(\d')
+
+def compile_rules(match_patterns):
+    """编译匹配规则，返回 find_rule(提交信息)：命中时返回规则名，否则返回None"""
+    rule_names = list(match_patterns)
+    combined_pattern = None
+    # 按编号的反向引用在规则合并后含义改变，这时不合并
+    if not any(_NUMBERED_GROUP_REF_RE.search(pattern) for pattern in match_patterns.values()):
+        try:
+            # 所有规则合并成一个正则，第i条规则对应命名分组 rule{i}，一次扫描即可判断
+            combined_pattern = re.compile(
+                '|'.join(f"(?P<rule{i}>{pattern})" for i, pattern in enumerate(match_patterns.values())),
+                re.IGNORECASE
+            )
+        except re.error:
+            # 单独能编译的规则合并后不一定能编译（如以(?i)开头、分组重名）
+            pass
+    
+    if combined_pattern is None:
+        # 逐条规则匹配
+        patterns = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in match_patterns.items()]
+        return lambda message: next((name for name, pattern in patterns if pattern.search(message)), None)
+    
+    def find_rule(message):
+        match = combined_pattern.search(message)
+        return rule_names[int(match.lastgroup[len('rule'):])] if match else None
+    return find_rule
+
+def iter_log_entries(log_xml):
+    """流式解析 svn log --xml 的输出，依次产出 (版本号, 作者, 提交信息)"""
+    for _, elem in ET.iterparse(io.BytesIO(log_xml), events=('end',)):
+        if elem.tag == 'logentry':
+            yield elem.get('revision'), elem.findtext('author'), elem.findtext('msg') or ''
+            elem.clear()
+
+def trigger_auto_merge(config, repository_path, revision, author, commit_message):
     """触发自动合并"""
     try:
         # 创建合并请求文件
         merge_request = {
             "revision": revision,
+            "repository": repository_path,
             "author": author,
             "message": commit_message,
             "timestamp": time.time(),
             "status": "pending"
         }
         
-        # 保存到文件
-        request_file = Path("merge_requests.json")
-        requests = []
-        
-        if request_file.exists():
-            try:
-                with open(request_file, 'r', encoding='utf-8') as f:
-                    requests = json.load(f)
-            except:
-                requests = []
-        
-        requests.append(merge_request)
-        
-        with open(request_file, 'w', encoding='utf-8') as f:
-            json.dump(requests, f, indent=2, ensure_ascii=False)
+        # 追加到请求队列文件
+        append_request(merge_request)
         
+        # Hook模式监听请求文件的变化，追加后不需要另外通知
         print(f"Merge request saved for revision {revision}")
         
-        # 通知主程序处理合并请求
-        notify_main_program()
-        
     except Exception as e:
         print(f"Failed to trigger auto merge: {e}")
 
-def notify_main_program():
-    """通知主程序处理合并请求"""
-    try:
-        # 创建一个信号文件
-        signal_file = Path("hook_signal.txt")
-        signal_file.write_text(str(time.time()), encoding='utf-8')
-        print("Signal sent to main program")
-    except Exception as e:
-        print(f"Failed to notify main program: {e}")
-
 if __name__ == "__main__":
     main()